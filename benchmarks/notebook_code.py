@@ -0,0 +1,119 @@
+"""The implementations in the chapter 8 and 11 notebooks, copied here so the benchmarks can time them next to the modules replacing them."""
+
+import numpy as np
+import pandas as pd
+
+def get_hourly_ip_logs(log):
+    """
+    Aggregate the logs per IP address and hour (like `hourly_ip_logs` in `ch_08/anomaly_detection.ipynb`).
+
+    Parameters:
+        - log: The logs dataframe
+
+    Returns:
+        A `pandas.DataFrame` with a row per IP address and hour that had log in attempts.
+    """
+    # the notebook resamples with '1H', which newer versions of pandas reject
+    return log.assign(
+        failures=lambda x: np.invert(x.success)
+    ).groupby('source_ip').resample('1h').agg(
+        {'username': 'nunique', 'success': 'sum', 'failures': 'sum'}
+    ).assign(
+        attempts=lambda x: x.success + x.failures,
+        success_rate=lambda x: x.success / x.attempts,
+        failure_rate=lambda x: 1 - x.success_rate
+    ).dropna().reset_index()
+
+def get_baselines(hourly_ip_logs, func, *args, **kwargs):
+    """
+    Calculate hourly bootstrapped statistic per column.
+
+    Parameters:
+        - hourly_ip_logs: Data to sample from.
+        - func: Statistic to calculate.
+        - args: Additional positional arguments for `func`
+        - kwargs: Additional keyword arguments for `func`
+
+    Returns:
+        `pandas.DataFrame` of hourly bootstrapped statistics
+    """
+    if isinstance(func, str):
+        func = getattr(pd.DataFrame, func)
+
+    return hourly_ip_logs\
+        .assign(hour=lambda x: x.datetime.dt.hour).groupby('hour')\
+        .apply(
+            lambda x: x.sample(10, random_state=0, replace=True)\
+                .pipe(func, *args, **kwargs, numeric_only=True)
+        )
+
+def trim(x, quantile):
+    """Remove rows with entries for the username, attempts, or failure_rate columns above a given quantile."""
+    mask = ((x.username <= x.username.quantile(quantile))
+        & (x.attempts <= x.attempts.quantile(quantile))
+        & (x.failure_rate <= x.failure_rate.quantile(quantile)))
+    return x[mask]
+
+def get_trimmed_hourly_logs(hourly_ip_logs, quantile=0.95):
+    """Trim the data per hour (like `trimmed_hourly_logs` in `ch_08/anomaly_detection.ipynb`)."""
+    # newer versions of pandas leave the grouping column out of `apply()`, so it may not be there to drop
+    return hourly_ip_logs\
+        .assign(hour=lambda x: x.datetime.dt.hour)\
+        .groupby('hour').apply(lambda x: trim(x, quantile))\
+        .drop(columns='hour', errors='ignore').reset_index().iloc[:,2:]
+
+def get_all_baselines(hourly_ip_logs):
+    """Calculate the baselines of all three rules in the chapter 8 notebook (percent change, Tukey fence, Z-score)."""
+    trimmed = get_trimmed_hourly_logs(hourly_ip_logs)
+    q3 = get_baselines(trimmed, 'quantile', .75).drop(columns=['hour'], errors='ignore')
+    q1 = get_baselines(trimmed, 'quantile', .25).drop(columns=['hour'], errors='ignore')
+    return (
+        get_baselines(hourly_ip_logs, 'mean'),
+        (q3 + 3 * (q3 - q1)).reset_index(),
+        get_baselines(trimmed, 'mean'),
+        get_baselines(trimmed, 'std')
+    )
+
+def get_X(log, day):
+    """
+    Get data we can use for the X (like `get_X()` in the chapter 11 notebooks before they used `feature_store`).
+
+    Parameters:
+        - log: The logs dataframe
+        - day: A day or single value we can use as a datetime index slice
+
+    Returns:
+        A `pandas.DataFrame` object
+    """
+    return pd.get_dummies(log.loc[day].assign(
+        failures=lambda x: 1 - x.success
+    ).query('failures > 0').resample('1min').agg(
+        {'username': 'nunique', 'failures': 'sum'}
+    ).dropna().rename(
+        columns={'username': 'usernames_with_failures'}
+    ).assign(
+        day_of_week=lambda x: x.index.dayofweek,
+        hour=lambda x: x.index.hour
+    ).drop(columns=['failures']), columns=['day_of_week', 'hour'])
+
+def get_y(datetimes, hackers, resolution='1min'):
+    """
+    Get data we can use for the y (like `get_y()` in the chapter 11 notebooks).
+
+    Parameters:
+        - datetimes: The datetimes to check for hackers
+        - hackers: The dataframe indicating when the attacks started and stopped,
+                   with the `start_floor` and `end_ceil` columns the notebooks add.
+        - resolution: The granularity of the datetime. Default is 1 minute.
+
+    Returns:
+        `pandas.Series` of Booleans.
+    """
+    date_ranges = hackers.apply(
+        lambda x: pd.date_range(x.start_floor, x.end_ceil, freq=resolution),
+        axis=1
+    )
+    dates = pd.Series(dtype='object')
+    for date_range in date_ranges:
+        dates = pd.concat([dates, date_range.to_series()])
+    return datetimes.isin(dates)
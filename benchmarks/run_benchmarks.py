@@ -0,0 +1,388 @@
+"""Script for benchmarking the login log analysis pipeline and `window_calc()` on synthetic data."""
+
+import argparse
+import datetime as dt
+import gc
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+# the code being benchmarked lives in the chapter directories
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for chapter in ['ch_04', 'ch_08', 'ch_11']:
+    sys.path.insert(0, os.path.join(REPO, chapter))
+
+import attack_labels
+import bootstrap
+import feature_store
+from hourly_ip_logs import get_hourly_ip_logs
+import merge_logs
+import notebook_code
+from window_calc import window_calc
+import window_engines
+
+# Logging configuration
+FORMAT = '[%(levelname)s] [ %(name)s ] %(message)s'
+logging.basicConfig(level=logging.INFO, format=FORMAT)
+logger = logging.getLogger(os.path.basename(__file__))
+
+YEAR = 2018
+MAX_NOTEBOOK_ROWS = 100_000 # the notebook's groupby-resample needs memory for every IP address and hour
+WINDOW_AGG = {'high': 'max', 'low': 'min', 'close': 'mean', 'volume': 'sum'}
+ORDER_STATISTICS_AGG = {'close': [window_engines.window_quantile(0.9), window_engines.window_rank(pct=True)]}
+
+def make_log(rows, year=YEAR, seed=0):
+    """
+    Make a synthetic login attempt log covering a year (plus a day spilling into the next one)
+    along with the attacks in it.
+
+    Parameters:
+        - rows: The number of login attempts.
+        - year: The year of the log.
+        - seed: The seed for the random number generator.
+
+    Returns:
+        A tuple of `pandas.DataFrame` objects shaped like the merged logs of chapter 11:
+        (log indexed by datetime, hack log with `start`, `end`, and `source_ip` columns).
+    """
+    rng = np.random.default_rng(seed)
+    ips = max(rows // 100, 10)
+    users = max(rows // 200, 10)
+    ip_pool = np.array([
+        f'{a}.{b}.{c}.{d}' for a, b, c, d in rng.integers(1, 255, size=(ips, 4))
+    ], dtype=object)
+    user_pool = np.array([f'user{i}' for i in range(users)], dtype=object)
+
+    start = pd.Timestamp(year=year, month=1, day=1)
+    span = (pd.Timestamp(year=year + 1, month=1, day=2) - start).value
+    success = rng.random(rows) < 0.8
+    log = pd.DataFrame({
+        'source_ip': ip_pool[rng.integers(0, ips, size=rows)],
+        'username': user_pool[rng.integers(0, users, size=rows)],
+        'success': success,
+        'failure_reason': np.where(success, None, 'error_wrong_password')
+    }, index=pd.DatetimeIndex(start.value + np.sort(rng.integers(0, span, size=rows)), name='datetime'))
+
+    attacks = max(rows // 10000, 5)
+    attack_starts = start + pd.to_timedelta(np.sort(rng.integers(0, span, size=attacks)), unit='ns')
+    hackers = pd.DataFrame({
+        'start': attack_starts,
+        'end': attack_starts + pd.to_timedelta(rng.integers(1, 60, size=attacks), unit='min'),
+        'source_ip': ip_pool[rng.integers(0, ips, size=attacks)]
+    })
+    return log, hackers
+
+def make_prices(rows, seed=0):
+    """
+    Make synthetic minute-level stock prices (like `ch_04/data/fb_week_of_may_20_per_minute.csv`).
+
+    Parameters:
+        - rows: The number of minutes.
+        - seed: The seed for the random number generator.
+
+    Returns:
+        A `pandas.DataFrame` with the open, high, low, close, and volume, indexed by datetime.
+    """
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.001, size=rows)))
+    spread = np.abs(rng.normal(0, 0.002, size=(2, rows))) * close
+    return pd.DataFrame({
+        'open': np.concatenate([[close[0]], close[:-1]]),
+        'high': close + spread[0],
+        'low': close - spread[1],
+        'close': close,
+        'volume': rng.integers(100, 10000, size=rows)
+    }, index=pd.date_range(f'{YEAR}-01-01', periods=rows, freq='min', name='date'))
+
+class Workload:
+    """
+    The synthetic data for one size, built (and cached) the first time a stage needs it.
+
+    Parameters:
+        - rows: The number of rows to generate.
+        - directory: The directory to write the files needed (monthly logs, feature cache) to.
+        - seed: The seed for the random number generator.
+    """
+    def __init__(self, rows, directory, seed=0):
+        self.rows = rows
+        self.directory = directory
+        self.seed = seed
+        self._cache = {}
+
+    def _get(self, name, make):
+        """Build the data the first time it is requested."""
+        if name not in self._cache:
+            self._cache[name] = make()
+        return self._cache[name]
+
+    def log(self):
+        """The login attempt log."""
+        return self._get('log_and_hackers', lambda: make_log(self.rows, seed=self.seed))[0]
+
+    def hackers(self):
+        """The attacks in the log."""
+        return self._get('log_and_hackers', lambda: make_log(self.rows, seed=self.seed))[1]
+
+    def month_files(self):
+        """
+        Write the log to monthly CSV files like the simulation does (the last one
+        spilling into the next year) and return the pattern and month list for `cat_csvs()`.
+        """
+        def write():
+            months = []
+            log = self.log()
+            month_numbers = np.where(log.index.year > YEAR, 12, log.index.month)
+            for number, month in enumerate(merge_logs.MONTHS, start=1):
+                months.append(f'{month}_{YEAR}')
+                log[month_numbers == number].to_csv(os.path.join(self.directory, f'{months[-1]}.csv'))
+            return os.path.join(self.directory, '{}.csv'), months
+        return self._get('month_files', write)
+
+    def merged_log(self):
+        """The log as `cat_csvs()` returns it."""
+        pattern, months = self.month_files()
+        return self._get('merged_log', lambda: merge_logs.cat_csvs(pattern, 'datetime', months))
+
+    def hourly_ip_logs(self):
+        """The log aggregated per IP address and hour."""
+        return self._get('hourly_ip_logs', lambda: get_hourly_ip_logs(self.log()))
+
+    def minutes(self):
+        """The datetimes of every minute of the year (like the index of the X)."""
+        return self._get('minutes', lambda: pd.Series(
+            pd.date_range(f'{YEAR}-01-01', f'{YEAR}-12-31 23:59', freq='min', name='datetime')
+        ))
+
+    def fresh_feature_cache(self):
+        """The file for the feature store to cache the features in, removing what an earlier run cached there."""
+        cache_file = os.path.join(self.directory, 'feature_cache.pkl')
+        if os.path.exists(cache_file):
+            os.remove(cache_file)
+        return cache_file
+
+    def feature_store(self):
+        """A feature store that already has the features for the log."""
+        return self._get('feature_store', lambda: feature_store.FeatureStore(
+            os.path.join(self.directory, 'warm_feature_cache.pkl')
+        ).update(self.log()))
+
+    def notebook_hackers(self):
+        """The attacks with the `start_floor` and `end_ceil` columns the notebooks add."""
+        return self._get('notebook_hackers', lambda: self.hackers().assign(
+            start_floor=lambda x: x.start.dt.floor('min'),
+            end_ceil=lambda x: x.end.dt.ceil('min')
+        ))
+
+    def prices(self):
+        """Minute-level prices with as many rows as the log."""
+        return self._get('prices', lambda: make_prices(self.rows, seed=self.seed))
+
+    def ticker_prices(self):
+        """The prices split between 4 tickers (every fourth minute belonging to the same one)."""
+        return self._get('ticker_prices', lambda: self.prices().assign(ticker=np.arange(self.rows) % 4))
+
+def get_baselines(hourly_ip_logs):
+    """Calculate the baselines of all three rules in the chapter 8 notebook (percent change, Tukey fence, Z-score)."""
+    trimmed = bootstrap.trim(hourly_ip_logs, 0.95)
+    return (
+        bootstrap.get_baselines(hourly_ip_logs, 'mean'),
+        bootstrap.tukey_fence_bounds(trimmed, 3),
+        bootstrap.get_baselines(trimmed, 'mean'),
+        bootstrap.get_baselines(trimmed, 'std')
+    )
+
+def get_X(log, day, cache_file):
+    """Build the X for the day with a new feature store (so nothing is reused from an earlier run)."""
+    return feature_store.FeatureStore(cache_file).update(log).get_X(day)
+
+# for each stage: a function preparing the arguments from the workload (not timed, run before each call)
+# and the function to time; the `notebook_` stages time the code in the notebooks the modules replace
+# and are only run up to `MAX_NOTEBOOK_ROWS` rows by default
+STAGES = {
+    'cat_csvs': (lambda w: (w.month_files()[0], 'datetime', w.month_files()[1]), merge_logs.cat_csvs),
+    'get_spillover': (lambda w: (w.merged_log(), str(YEAR + 1)), merge_logs.get_spillover),
+    'hourly_ip_logs': (lambda w: (w.log(),), get_hourly_ip_logs),
+    'baselines': (lambda w: (w.hourly_ip_logs(),), get_baselines),
+    'get_X': (lambda w: (w.log(), str(YEAR), w.fresh_feature_cache()), get_X),
+    'get_X_cached': (lambda w: (w.feature_store(), str(YEAR)), feature_store.FeatureStore.get_X),
+    'get_y': (lambda w: (w.minutes(), w.hackers()), attack_labels.get_y),
+    'notebook_hourly_ip_logs': (lambda w: (w.log(),), notebook_code.get_hourly_ip_logs),
+    'notebook_baselines': (lambda w: (w.hourly_ip_logs(),), notebook_code.get_all_baselines),
+    'notebook_get_X': (lambda w: (w.log(), str(YEAR)), notebook_code.get_X),
+    'notebook_get_y': (lambda w: (w.minutes(), w.notebook_hackers()), notebook_code.get_y),
+    'window_calc_rolling': (
+        lambda w: (w.prices(), pd.DataFrame.rolling, WINDOW_AGG, '1D'), window_calc
+    ),
+    'window_calc_expanding': (lambda w: (w.prices(), pd.DataFrame.expanding, WINDOW_AGG), window_calc),
+    'window_calc_ewm': (lambda w: (w.prices(), pd.DataFrame.ewm, 'mean'), lambda *args: window_calc(*args, span=5)),
+    'window_calc_order_statistics': (
+        lambda w: (w.prices(), pd.DataFrame.rolling, ORDER_STATISTICS_AGG, '1D'), window_engines.window_calc
+    ),
+    # always in 2 processes, so the aggregations have to make it to them
+    'grouped_window_calc_order_statistics': (
+        lambda w: (w.ticker_prices(), 'ticker', pd.DataFrame.rolling, ORDER_STATISTICS_AGG, '1D'),
+        lambda *args: window_engines.grouped_window_calc(*args, workers=2, min_rows=0)
+    )
+}
+
+def measure(func, prepare, repeat=1, memory=True):
+    """
+    Time a function (keeping the fastest run) and trace the peak memory it allocates (in a separate run).
+
+    Parameters:
+        - func: The function to measure.
+        - prepare: Function returning the arguments to call it with, called (untimed) before every run.
+        - repeat: The number of times to time it.
+        - memory: Whether to measure the peak memory (tracing memory slows the function down).
+
+    Returns:
+        A dictionary with the seconds and the peak memory in MB (`None` if it wasn't measured).
+    """
+    times = []
+    for _ in range(repeat):
+        args = prepare()
+        gc.collect()
+        start = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - start)
+
+    peak = None
+    if memory:
+        args = prepare()
+        gc.collect()
+        tracemalloc.start()
+        try:
+            func(*args)
+            peak = tracemalloc.get_traced_memory()[1] / 2**20
+        finally:
+            tracemalloc.stop()
+    return {'seconds': min(times), 'peak_memory_mb': peak}
+
+def run_benchmarks(sizes, stages=None, repeat=1, memory=True, seed=0, max_notebook_rows=MAX_NOTEBOOK_ROWS):
+    """
+    Run the stages on synthetic data of each size.
+
+    Parameters:
+        - sizes: The numbers of rows to benchmark.
+        - stages: The names of the stages to run (defaults to all of them, see `STAGES`).
+        - repeat: The number of times to time each stage.
+        - memory: Whether to measure the peak memory of each stage.
+        - seed: The seed for generating the data.
+        - max_notebook_rows: Skip the `notebook_` stages for sizes above this many rows.
+
+    Returns:
+        A dictionary with the environment and a list of results (one per stage and size).
+    """
+    results = []
+    for rows in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            workload = Workload(rows, directory, seed)
+            for stage in stages or STAGES:
+                if stage.startswith('notebook_') and rows > max_notebook_rows:
+                    logger.info(f'Skipping {stage} on {rows:,d} rows (see --max-notebook-rows)')
+                    continue
+                prepare, func = STAGES[stage]
+                result = {
+                    'stage': stage, 'rows': rows,
+                    **measure(func, lambda: prepare(workload), repeat, memory)
+                }
+                logger.info(
+                    f"{stage} on {rows:,d} rows: {result['seconds']:.3f} seconds"
+                    + (f", peak of {result['peak_memory_mb']:.1f} MB" if memory else '')
+                )
+                results.append(result)
+            del workload
+            gc.collect()
+
+    return {
+        'created': dt.datetime.now().isoformat(timespec='seconds'),
+        'environment': {
+            'python': platform.python_version(), 'pandas': pd.__version__, 'numpy': np.__version__,
+            'machine': platform.machine(), 'processor': platform.processor(), 'cpus': os.cpu_count()
+        },
+        'repeat': repeat, 'seed': seed, 'max_notebook_rows': max_notebook_rows,
+        'results': results
+    }
+
+def compare(results, baseline, tolerance=0.2):
+    """
+    Compare benchmark results to a baseline.
+
+    Parameters:
+        - results: The results of `run_benchmarks()`.
+        - baseline: Earlier results of `run_benchmarks()` to compare to.
+        - tolerance: How much slower (or more memory) than the baseline counts as a regression,
+                     as a fraction of the baseline (0.2 means more than 20% worse).
+
+    Returns:
+        A `pandas.DataFrame` with the ratio to the baseline and whether it's a regression,
+        for each stage and size that is in both.
+    """
+    index = ['stage', 'rows']
+    comparison = pd.DataFrame(results['results']).merge(
+        pd.DataFrame(baseline['results']), on=index, suffixes=('', '_baseline')
+    ).set_index(index)
+
+    for metric in ['seconds', 'peak_memory_mb']:
+        comparison[f'{metric}_ratio'] = \
+            comparison[metric].astype(float) / comparison[f'{metric}_baseline'].astype(float)
+    comparison['regression'] = (
+        comparison[['seconds_ratio', 'peak_memory_mb_ratio']] > 1 + tolerance
+    ).any(axis=1)
+    return comparison
+
+if __name__ == '__main__':
+    # command line argument parsing
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '-s', '--sizes', type=int, nargs='+', default=[10_000, 1_000_000, 10_000_000],
+        help='numbers of rows to benchmark'
+    )
+    parser.add_argument(
+        '-t', '--stages', nargs='+', choices=list(STAGES), help='stages to run (defaults to all of them)'
+    )
+    parser.add_argument(
+        '-r', '--repeat', type=int, default=1, help='times to time each stage (keeping the fastest)'
+    )
+    parser.add_argument(
+        '-nm', '--no-memory', action='store_true', help="don't trace the peak memory (saves a run of each stage)"
+    )
+    parser.add_argument(
+        '-mn', '--max-notebook-rows', type=int, default=MAX_NOTEBOOK_ROWS,
+        help=f'largest size to run the (slow) notebook_ stages on (default {MAX_NOTEBOOK_ROWS:,d})'
+    )
+    parser.add_argument('-o', '--output', help='file to write the results to as JSON')
+    parser.add_argument('-b', '--baseline', help='results file (from --output) to compare to')
+    parser.add_argument(
+        '-tol', '--tolerance', type=float, default=0.2,
+        help='fraction worse than the baseline to count as a regression (default 0.2)'
+    )
+    args = parser.parse_args()
+
+    results = run_benchmarks(
+        args.sizes, args.stages, args.repeat, memory=not args.no_memory, max_notebook_rows=args.max_notebook_rows
+    )
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+        logger.info(f'Saved the results to {args.output}')
+
+    if args.baseline:
+        with open(args.baseline, 'r') as file:
+            comparison = compare(results, json.load(file), args.tolerance)
+        print(comparison.to_string())
+        regressions = comparison[comparison.regression]
+        if not regressions.empty:
+            logger.error(f'{len(regressions)} regressions of more than {args.tolerance:.0%}')
+            sys.exit(1)
+        logger.info(f'No regressions of more than {args.tolerance:.0%}')
+    else:
+        print(pd.DataFrame(results['results']).to_string(index=False))
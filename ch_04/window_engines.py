@@ -0,0 +1,894 @@
+"""Utility functions for running window calculations like `window_calc()` on bigger, growing, or grouped data."""
+
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+# aggregations that can be calculated from the running sums shared by all the windows
+CUMSUM_AGGS = ('sum', 'mean', 'var', 'std')
+
+def window_calc(df, func, agg_dict, *args, **kwargs):
+    """
+    Run a window calculation of your choice on a `DataFrame` object, like `window_calc()` in
+    `window_calc.py`, except that the aggregations made by `window_quantile()` and `window_rank()`
+    are calculated for all the rolling or expanding windows at once with `order_statistics()`.
+
+    Parameters:
+        - df: The `DataFrame` object to run the calculation on.
+        - func: The window calculation method that takes `df`
+          as the first argument.
+        - agg_dict: Information to pass to `agg()`, could be a
+          dictionary mapping the columns to the aggregation
+          function to use, a string name for the function,
+          or the function itself.
+        - args: Positional arguments to pass to `func`.
+        - kwargs: Keyword arguments to pass to `func`.
+
+    Returns:
+        A new `DataFrame` object.
+    """
+    window = df.pipe(func, *args, **kwargs)
+    if func in (pd.DataFrame.rolling, pd.DataFrame.expanding):
+        pairs = _normalize_agg_dict(agg_dict, df.columns)
+        if any(hasattr(agg, 'order_statistic') for column, agg in pairs):
+            starts = _window_starts(df, func, args, kwargs)
+            if starts is not None:
+                return _order_statistics_window_calc(df, window, agg_dict, pairs, *starts)
+    return window.agg(agg_dict)
+
+def _order_statistics_window_calc(df, window, agg_dict, pairs, starts, min_periods):
+    """
+    Finish `window_calc()` when there are aggregations made by `window_quantile()` or `window_rank()`,
+    calculating them with `order_statistics()` and leaving the rest to pandas.
+    """
+    others = {}
+    statistics = {}
+    for column, agg in pairs:
+        if hasattr(agg, 'order_statistic'):
+            statistics.setdefault(column, []).append(agg)
+        else:
+            others.setdefault(column, []).append(agg)
+    results = window.agg(others) if others else None
+
+    out = {}
+    for column, aggs in statistics.items():
+        calculated = order_statistics(
+            df[column].to_numpy(dtype=float), starts, min_periods, [agg.order_statistic for agg in aggs]
+        )
+        out.update(((column, _agg_name(agg)), result) for agg, result in zip(aggs, calculated))
+
+    # the same columns that `agg()` would have given
+    if isinstance(agg_dict, dict):
+        flat = not any(isinstance(aggs, (list, tuple)) for aggs in agg_dict.values())
+    else:
+        flat = not isinstance(agg_dict, (list, tuple))
+    keys = [(column, _agg_name(agg)) for column, agg in pairs]
+    return pd.DataFrame(
+        np.column_stack([
+            out[key] if key in out else results[key].to_numpy(dtype=float) for key in keys
+        ]).reshape(len(df), len(keys)),
+        index=df.index,
+        columns=[column for column, agg in keys] if flat else pd.MultiIndex.from_tuples(keys)
+    )
+
+def _parse_window(window):
+    """Split a window spec like `(pd.DataFrame.rolling, '7D')` into the function, args, and kwargs."""
+    func, *args = window
+    kwargs = args.pop() if args and isinstance(args[-1], dict) else {}
+    return func, args, kwargs
+
+def _window_label(func, args, kwargs):
+    """Label a window spec the way it would be called, like "rolling('7D')" or 'ewm(span=5)'."""
+    arguments = [repr(arg) for arg in args] + [f'{key}={value!r}' for key, value in kwargs.items()]
+    return f"{func.__name__}({', '.join(arguments)})"
+
+def _agg_name(agg):
+    """Get the name `agg()` gives the column for an aggregation."""
+    return agg if isinstance(agg, str) else agg.__name__
+
+def _normalize_agg_dict(agg_dict, columns):
+    """Turn what can be passed to `agg()` into a list of (column, aggregation) pairs."""
+    if not isinstance(agg_dict, dict):
+        agg_dict = {column: agg_dict for column in columns}
+    return [
+        (column, agg)
+        for column, aggs in agg_dict.items()
+        for agg in (aggs if isinstance(aggs, (list, tuple)) else [aggs])
+    ]
+
+def _window_starts(df, func, args, kwargs):
+    """
+    Find where the window ending at each row starts (as a position) and the minimum number of
+    observations it needs, or `None` if the window can't be calculated from running sums.
+    """
+    kwargs = dict(kwargs)
+    if func is pd.DataFrame.expanding and not args and set(kwargs) <= {'min_periods'}:
+        return np.zeros(len(df), dtype=np.int64), kwargs.get('min_periods', 1)
+
+    if func is not pd.DataFrame.rolling:
+        return None
+    if args:
+        kwargs['window'] = args[0]
+    if set(kwargs) - {'window', 'min_periods'}:
+        return None
+
+    window = kwargs['window']
+    positions = np.arange(len(df))
+    if isinstance(window, (int, np.integer)):
+        starts = np.maximum(positions - window + 1, 0)
+        return starts, kwargs.get('min_periods', window)
+
+    if not isinstance(df.index, pd.DatetimeIndex) or not df.index.is_monotonic_increasing:
+        return None
+    try:
+        size = pd.Timedelta(window)
+    except ValueError:
+        # offsets that aren't a fixed length are left to pandas
+        return None
+    # time-based windows cover (t - window, t]
+    starts = df.index.searchsorted(df.index - size, side='right').astype(np.int64)
+    return starts, kwargs.get('min_periods', 1)
+
+def _running_sums(values, squares=True):
+    """
+    Calculate the running count, sum, and (optionally) sum of squares of each column, prepended
+    with zeros. The columns are centered first, so that the sums of squares don't lose precision.
+    """
+    present = ~np.isnan(values)
+    with warnings.catch_warnings():
+        # columns that are all NaN don't have a mean
+        warnings.simplefilter('ignore', RuntimeWarning)
+        centers = np.nan_to_num(np.nanmean(values, axis=0)) if len(values) else np.zeros(values.shape[1])
+    centered = np.where(present, values - centers, 0)
+
+    def cumsum(data):
+        # column by column, so that every column is contiguous
+        running = np.zeros((data.shape[0] + 1, data.shape[1]), order='F')
+        np.cumsum(data, axis=0, out=running[1:])
+        return running
+
+    return cumsum(present), cumsum(centered), cumsum(centered ** 2) if squares else None, centers
+
+def _window_sum(running, starts):
+    """Get the sum in each window from the running sum (of a single column)."""
+    # `starts` never decreases, so it's all zeros (an expanding window) if the last one is
+    if not len(starts) or not starts[-1]:
+        return running[1:]
+    return running[1:] - running[starts]
+
+def _cumsum_agg(agg, count, total, squares, center, invalid, out):
+    """Calculate an aggregation for every window from its sums, writing it to `out`."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if agg == 'sum':
+            np.multiply(count, center, out=out)
+            out += total
+        elif agg == 'mean':
+            np.divide(total, count, out=out)
+            out += center
+        else:
+            np.square(total, out=out)
+            out /= count
+            np.subtract(squares, out, out=out)
+            out /= count - 1
+            np.maximum(out, 0, out=out)
+            out[count < 2] = np.nan
+            if agg == 'std':
+                np.sqrt(out, out=out)
+    out[invalid] = np.nan
+
+def multi_window_calc(df, windows, agg_dict):
+    """
+    Run several window calculations on a `DataFrame` object at once, like calling `window_calc()`
+    for each of them. Rolling and expanding sums, means, variances, and standard deviations
+    are all calculated from the same running sums (so the data is only scanned once for them);
+    anything else falls back to `window_calc()`.
+
+    Parameters:
+        - df: The `DataFrame` object to run the calculations on.
+        - windows: A list of window specs, each a tuple of the window calculation
+          method and the arguments to pass to it, with the keyword arguments
+          as a dictionary at the end, if any. For example,
+          `[(pd.DataFrame.rolling, '7D'), (pd.DataFrame.expanding,), (pd.DataFrame.ewm, {'span': 5})]`
+        - agg_dict: Information to pass to `agg()` for every window, like in `window_calc()`.
+
+    Returns:
+        A new `DataFrame` object with a column per window spec, column, and aggregation.
+    """
+    pairs = _normalize_agg_dict(agg_dict, df.columns)
+    numeric = set(df.select_dtypes(include=['number', 'bool']).columns)
+    sum_columns = list(dict.fromkeys(
+        column for column, agg in pairs if column in numeric and agg in CUMSUM_AGGS
+    ))
+    sums = None
+
+    windows = [_parse_window(window) for window in windows]
+    labels = [
+        (_window_label(func, args, kwargs), column, _agg_name(agg))
+        for func, args, kwargs in windows for column, agg in pairs
+    ]
+    # one column per label, each of them contiguous
+    out = np.empty((len(df), len(labels)), order='F')
+
+    for number, (func, args, kwargs) in enumerate(windows):
+        first = number * len(pairs)
+        starts = _window_starts(df, func, args, kwargs) if sum_columns else None
+        done = set()
+        if starts is not None:
+            if sums is None:
+                sums = _running_sums(
+                    df[sum_columns].to_numpy(dtype=float),
+                    squares=any(agg in ('var', 'std') for column, agg in pairs if column in sum_columns)
+                )
+            starts, min_periods = starts
+            for position, column in enumerate(sum_columns):
+                count, total, squares = (
+                    _window_sum(running[:, position], starts) if running is not None else None
+                    for running in sums[:3]
+                )
+                invalid = count < max(min_periods, 1)
+                for offset, (pair_column, agg) in enumerate(pairs):
+                    if pair_column == column and agg in CUMSUM_AGGS:
+                        _cumsum_agg(
+                            agg, count, total, squares, sums[3][position], invalid, out[:, first + offset]
+                        )
+                        done.add(offset)
+
+        fallback = {}
+        for offset, (column, agg) in enumerate(pairs):
+            if offset not in done:
+                fallback.setdefault(column, []).append(agg)
+        if fallback:
+            result = window_calc(df, func, fallback, *args, **kwargs)
+            for offset, (column, agg) in enumerate(pairs):
+                if offset not in done:
+                    out[:, first + offset] = result[(column, _agg_name(agg))].to_numpy(dtype=float)
+
+    return pd.DataFrame(
+        out, index=df.index, columns=pd.MultiIndex.from_tuples(labels, names=['window', 'column', 'agg']),
+        copy=False
+    )
+
+def _ewm_alpha(kwargs):
+    """Get the smoothing factor `ewm()` uses from its keyword arguments."""
+    if kwargs.get('alpha') is not None:
+        return kwargs['alpha']
+    if kwargs.get('span') is not None:
+        return 2 / (kwargs['span'] + 1)
+    if kwargs.get('halflife') is not None:
+        return 1 - np.exp(np.log(0.5) / kwargs['halflife'])
+    return 1 / (1 + kwargs['com'])
+
+class IncrementalWindowCalc:
+    """
+    Run a window calculation on a `DataFrame` object that keeps getting rows appended to it, like
+    a new trading day or minute of prices, without recalculating the whole history each time.
+    Only what the window needs is carried between updates: the rows still in the window for
+    rolling calculations, the running count, mean, sum of squared deviations, sum, minimum, and
+    maximum for expanding ones, and the weighted average and its weight for exponentially weighted
+    means. Any other window calculation keeps the whole history and recalculates it on update.
+
+    Parameters:
+        - df: The `DataFrame` object with the rows seen so far.
+        - func: The window calculation method that takes `df`
+          as the first argument, like in `window_calc()`.
+        - agg_dict: Information to pass to `agg()`, like in `window_calc()`.
+        - args: Positional arguments to pass to `func`.
+        - kwargs: Keyword arguments to pass to `func`.
+
+    Attributes:
+        - result: The result of `window_calc()` on `df`.
+    """
+
+    # aggregations of expanding windows that can be updated from the running totals
+    EXPANDING_AGGS = ('sum', 'mean', 'var', 'std', 'min', 'max')
+    EWM_KWARGS = {'com', 'span', 'halflife', 'alpha', 'min_periods', 'adjust', 'ignore_na'}
+
+    def __init__(self, df, func, agg_dict, *args, **kwargs):
+        self.func, self.agg_dict, self.args, self.kwargs = func, agg_dict, args, kwargs
+        self.result = window_calc(df, func, agg_dict, *args, **kwargs)
+        self.pairs = _normalize_agg_dict(agg_dict, df.columns)
+        self.state_columns = list(dict.fromkeys(column for column, agg in self.pairs))
+        self.mode = self._get_mode(df)
+
+        if self.mode == 'rolling':
+            self.rows = self._rolling_tail(df)
+        elif self.mode == 'expanding':
+            self._start_expanding(df[self.state_columns].to_numpy(dtype=float))
+        elif self.mode == 'ewm':
+            self._start_ewm(df)
+        else:
+            self.rows = df
+
+    def _get_mode(self, df):
+        """Pick the state to carry between updates."""
+        func, kwargs = self.func, dict(self.kwargs)
+        if func is pd.DataFrame.rolling:
+            if kwargs.get('center'):
+                raise ValueError("centered windows can't be updated incrementally")
+            window = self.args[0] if self.args else kwargs['window']
+            if isinstance(window, (int, np.integer)):
+                self.window_size = int(window)
+                return 'rolling'
+            try:
+                self.window_size = pd.Timedelta(window)
+            except (TypeError, ValueError):
+                return 'history'
+            return 'rolling' if isinstance(df.index, pd.DatetimeIndex) else 'history'
+
+        if any(not isinstance(agg, str) for column, agg in self.pairs):
+            return 'history'
+        numeric = set(df.select_dtypes(include=['number', 'bool']).columns)
+        if not set(self.state_columns) <= numeric:
+            return 'history'
+        if (
+            func is pd.DataFrame.expanding and not self.args and set(kwargs) <= {'min_periods'}
+            and all(agg in self.EXPANDING_AGGS for column, agg in self.pairs)
+        ):
+            self.min_periods = max(kwargs.get('min_periods', 1), 1)
+            return 'expanding'
+        if self.args:
+            kwargs['com'] = self.args[0]
+        if (
+            func is pd.DataFrame.ewm and set(kwargs) <= self.EWM_KWARGS
+            and not isinstance(kwargs.get('halflife'), (str, pd.Timedelta))
+            and all(agg == 'mean' for column, agg in self.pairs)
+        ):
+            self.ewm_kwargs = kwargs
+            return 'ewm'
+        return 'history'
+
+    def _rolling_tail(self, df):
+        """Get the rows that the windows of the rows to come can still include."""
+        if isinstance(self.window_size, int):
+            return df.iloc[max(len(df) - self.window_size + 1, 0):]
+        if not len(df):
+            return df
+        # kept inclusive, so that it works for any value of `closed`
+        return df[df.index >= df.index[-1] - self.window_size]
+
+    def _start_expanding(self, values):
+        """Calculate the running totals of each column."""
+        present = ~np.isnan(values)
+        self.count = present.sum(axis=0).astype(float)
+        self.total = np.where(present, values, 0).sum(axis=0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.mean = np.where(self.count > 0, self.total / self.count, 0)
+        self.squares = np.where(present, values - self.mean, 0) ** 2
+        self.squares = self.squares.sum(axis=0)
+        if len(values):
+            self.minimum, self.maximum = np.fmin.reduce(values, axis=0), np.fmax.reduce(values, axis=0)
+        else:
+            self.minimum = self.maximum = np.full(values.shape[1], np.nan)
+
+    def _start_ewm(self, df):
+        """Find the weighted average of each column and the weight it gets in the next update."""
+        values = df[self.state_columns].to_numpy(dtype=float)
+        present = ~np.isnan(values)
+        kwargs = self.ewm_kwargs
+        self.alpha = _ewm_alpha(kwargs)
+        self.adjust, self.ignore_na = kwargs.get('adjust', True), kwargs.get('ignore_na', False)
+        self.min_periods = max(kwargs.get('min_periods', 0), 1)
+        self.observations = present.sum(axis=0)
+
+        # the last average, even if there weren't `min_periods` observations for it
+        ewm_kwargs = {key: value for key, value in kwargs.items() if key != 'min_periods'}
+        averages = df[self.state_columns].astype(float).ewm(min_periods=0, **ewm_kwargs).mean()
+        self.average = (
+            averages.iloc[-1].to_numpy(dtype=float, copy=True) if len(df) else np.full(len(self.state_columns), np.nan)
+        )
+
+        # the weight decays with every row (or every observation if ignoring NaNs) after the first
+        # observation, and resets to 1 with each one unless adjusting for the imbalance of weights
+        factor = 1 - self.alpha
+        if self.ignore_na:
+            ages = np.cumsum(present[::-1], axis=0)[::-1] - 1
+        else:
+            ages = np.arange(len(values))[::-1, np.newaxis] + np.zeros((1, len(self.state_columns)))
+        weights = np.where(present, factor ** ages, 0)
+        if self.adjust:
+            self.weight = weights.sum(axis=0)
+        else:
+            self.weight = weights.max(axis=0, initial=0)
+        self.weight[self.observations == 0] = 1
+
+    def _update_expanding(self, values):
+        """Calculate the new rows of each aggregation from the running totals and update them."""
+        present = ~np.isnan(values)
+        count = self.count + np.cumsum(present, axis=0)
+        # deviations from the previous mean, so that the sums of squares don't lose precision
+        deviations = np.where(present, values - self.mean, 0)
+        shift = np.cumsum(deviations, axis=0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = self.mean + shift / count
+            squares = self.squares + np.cumsum(deviations ** 2, axis=0) - shift ** 2 / count
+            var = np.where(count > 1, np.maximum(squares, 0) / (count - 1), np.nan)
+        results = {
+            'sum': self.total + np.cumsum(np.where(present, values, 0), axis=0),
+            'mean': mean,
+            'var': var,
+            'std': np.sqrt(var),
+            'min': np.fmin(self.minimum, np.fmin.accumulate(values, axis=0)),
+            'max': np.fmax(self.maximum, np.fmax.accumulate(values, axis=0))
+        }
+
+        # copies, since the results are masked below
+        self.count, self.total = count[-1], results['sum'][-1].copy()
+        seen = self.count > 0
+        self.mean = np.where(seen, mean[-1], self.mean)
+        self.squares = np.where(seen, squares[-1], self.squares)
+        self.minimum, self.maximum = results['min'][-1].copy(), results['max'][-1].copy()
+
+        invalid = count < self.min_periods
+        for result in results.values():
+            result[invalid] = np.nan
+        return results
+
+    def _update_ewm(self, values):
+        """Calculate the new weighted averages row by row (the same way pandas does) and update them."""
+        factor, new_weight = 1 - self.alpha, 1 if self.adjust else self.alpha
+        out = np.empty_like(values)
+        for position, row in enumerate(values):
+            present = ~np.isnan(row)
+            self.observations += present
+            started = ~np.isnan(self.average)
+
+            self.weight[started & (present | (not self.ignore_na))] *= factor
+            combine = started & present
+            self.average[combine] = (
+                self.weight[combine] * self.average[combine] + new_weight * row[combine]
+            ) / (self.weight[combine] + new_weight)
+            if self.adjust:
+                self.weight[combine] += new_weight
+            else:
+                self.weight[combine] = 1
+            first = ~started & present
+            self.average[first] = row[first]
+
+            out[position] = np.where(self.observations >= self.min_periods, self.average, np.nan)
+        return {'mean': out}
+
+    def update(self, new_rows):
+        """
+        Add rows to the data and calculate the window calculation for them.
+
+        Parameters:
+            - new_rows: A `DataFrame` object with the same columns, coming after
+              the rows seen so far.
+
+        Returns:
+            A new `DataFrame` object with the rows of the result for `new_rows`,
+            the same as the last rows of `window_calc()` on all the data.
+        """
+        if not len(new_rows):
+            return pd.DataFrame(index=new_rows.index, columns=self.result.columns, dtype=float)
+
+        if self.mode in ('rolling', 'history'):
+            if (
+                isinstance(self.rows.index, pd.DatetimeIndex) and len(self.rows)
+                and new_rows.index[0] < self.rows.index[-1]
+            ):
+                raise ValueError('new rows have to come after the rows seen so far')
+            rows = pd.concat([self.rows, new_rows])
+            result = window_calc(rows, self.func, self.agg_dict, *self.args, **self.kwargs)
+            self.rows = self._rolling_tail(rows) if self.mode == 'rolling' else rows
+            return result.iloc[len(rows) - len(new_rows):]
+
+        values = new_rows[self.state_columns].to_numpy(dtype=float)
+        results = self._update_expanding(values) if self.mode == 'expanding' else self._update_ewm(values)
+        columns = self.result.columns
+        out = np.empty((len(new_rows), len(columns)))
+        for column, agg in self.pairs:
+            key = (column, agg) if isinstance(columns, pd.MultiIndex) else column
+            out[:, columns.get_loc(key)] = results[agg][:, self.state_columns.index(column)]
+        return pd.DataFrame(out, index=new_rows.index, columns=columns)
+
+def _share(array):
+    """Copy an array into a new block of shared memory, returning the block and the shared array."""
+    block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    shared = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf, order='F')
+    shared[...] = array
+    return block, shared
+
+def _make_index(values, tz):
+    """Turn the values of the index back into an index (datetimes are stored in UTC without the timezone)."""
+    if not np.issubdtype(values.dtype, np.datetime64):
+        return pd.Index(values)
+    index = pd.DatetimeIndex(values)
+    return index.tz_localize('UTC').tz_convert(tz) if tz else index
+
+def _group_window_calc(values, index, tz, out, bounds, columns, func, agg_dict, args, kwargs):
+    """Run `window_calc()` on the groups in the rows `start:stop` of `values`, writing the results to `out`."""
+    index = _make_index(index, tz)
+    for start, stop in bounds:
+        group = pd.DataFrame(values[start:stop], index=index[start:stop], columns=columns, copy=False)
+        out[start:stop] = window_calc(group, func, agg_dict, *args, **kwargs).to_numpy(dtype=float)
+
+def _shared_group_window_calc(blocks, tz, bounds, columns, func, agg_dict, args, kwargs):
+    """Attach to the shared memory of `grouped_window_calc()` and run the window calculation on some of the groups."""
+    attached = [shared_memory.SharedMemory(name=name) for name, shape, dtype in blocks]
+    arrays = [
+        np.ndarray(shape, dtype=dtype, buffer=block.buf, order='F') for block, (name, shape, dtype) in zip(attached, blocks)
+    ]
+    try:
+        _group_window_calc(*arrays[:2], tz, arrays[2], bounds, columns, func, agg_dict, args, kwargs)
+    finally:
+        # the arrays have to be gone before the memory can be closed
+        del arrays
+        for block in attached:
+            block.close()
+
+def grouped_window_calc(df, by, func, agg_dict, *args, workers=None, min_rows=100000, **kwargs):
+    """
+    Run a window calculation on each group of a `DataFrame` object, like the rows of each ticker
+    in a frame of several assets, splitting the groups between processes. The data is sorted by
+    group and put in shared memory, so the processes read and write it without copies being sent
+    to them. Small inputs (and machines with one CPU) are calculated in this process instead.
+
+    Parameters:
+        - df: The `DataFrame` object to run the calculation on, with the rows
+          of each group in order.
+        - by: The name of the column with the group of each row.
+        - func: The window calculation method that takes `df`
+          as the first argument, like in `window_calc()`.
+        - agg_dict: Information to pass to `agg()`, like in `window_calc()`.
+        - args: Positional arguments to pass to `func`.
+        - workers: The number of processes to use. Defaults to the number of CPUs.
+        - min_rows: The number of rows below which it isn't worth starting processes.
+        - kwargs: Keyword arguments to pass to `func`.
+
+    Returns:
+        A new `DataFrame` object with the results of each group in the rows they came
+        from (in the original order). Rows without a group are NaN.
+    """
+    data = df.drop(columns=by)
+    columns = list(agg_dict) if isinstance(agg_dict, dict) else list(data.columns)
+    codes = pd.factorize(df[by])[0]
+
+    # the rows of each group together (in their original order), so each group is a slice
+    order = np.argsort(codes, kind='stable')
+    # a column at a time, so the slices of each group can be used by pandas as they are
+    values = np.asfortranarray(data[columns].to_numpy(dtype=float)[order])
+    tz = getattr(df.index, 'tz', None)
+    if isinstance(df.index, pd.DatetimeIndex):
+        index = (df.index.tz_convert(None) if tz else df.index).to_numpy()[order]
+    else:
+        index = np.arange(len(df))[order]
+
+    sorted_codes = codes[order]
+    starts = np.flatnonzero(np.diff(sorted_codes, prepend=-2))
+    bounds = [
+        (start, stop) for start, stop in zip(starts, np.append(starts[1:], len(df)))
+        if sorted_codes[start] != -1
+    ]
+    if not bounds:
+        result = window_calc(data[columns], func, agg_dict, *args, **kwargs)
+        return result.reindex(df.index) if len(df) else result
+
+    # the first group gives the columns of the result
+    start, stop = bounds.pop(0)
+    first = window_calc(
+        pd.DataFrame(values[start:stop], index=_make_index(index[start:stop], tz), columns=columns),
+        func, agg_dict, *args, **kwargs
+    )
+    out = np.full((len(df), first.shape[1]), np.nan, order='F')
+    out[start:stop] = first.to_numpy(dtype=float)
+
+    workers = min(workers or os.cpu_count() or 1, len(bounds))
+    if len(df) < min_rows or workers < 2:
+        _group_window_calc(values, index, tz, out, bounds, columns, func, agg_dict, args, kwargs)
+    else:
+        # several tasks per process with about the same number of rows each
+        tasks, task, task_rows = [], [], 0
+        for start, stop in bounds:
+            task.append((start, stop))
+            task_rows += stop - start
+            if task_rows >= len(df) / (workers * 4):
+                tasks.append(task)
+                task, task_rows = [], 0
+        if task:
+            tasks.append(task)
+
+        shared, arrays = zip(*(_share(array) for array in (values, index, out)))
+        blocks = [(block.name, array.shape, array.dtype) for block, array in zip(shared, arrays)]
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                for future in [
+                    executor.submit(
+                        _shared_group_window_calc, blocks, tz, task, columns, func, agg_dict, args, kwargs
+                    )
+                    for task in tasks
+                ]:
+                    future.result()
+            out = arrays[-1].copy()
+        finally:
+            del arrays
+            for block in shared:
+                block.close()
+                block.unlink()
+
+    result = np.empty_like(out)
+    result[order] = out
+    return pd.DataFrame(result, index=df.index, columns=first.columns, copy=False)
+
+def _quantile(window, q, interpolation):
+    """Calculate the quantile of a window (see `window_quantile()`)."""
+    return pd.Series(window).quantile(q, interpolation=interpolation)
+
+def _rank(window, method, ascending, pct):
+    """Calculate the rank of the last value of a window (see `window_rank()`)."""
+    return pd.Series(window).rank(method=method, ascending=ascending, pct=pct).iloc[-1]
+
+class _WindowAggregation:
+    """
+    An aggregation made by `window_quantile()` or `window_rank()`. This is a class instead of a
+    closure so that it can be pickled (with its `order_statistic`) for `grouped_window_calc()`.
+
+    Parameters:
+        - func: The function calculating the statistic of a window.
+        - name: The name of the aggregation (for the column of the result).
+        - order_statistic: The statistic for `order_statistics()` to calculate.
+        - kwargs: Keyword arguments to pass to `func`.
+    """
+    def __init__(self, func, name, order_statistic, **kwargs):
+        self.func = func
+        self.__name__ = name
+        self.order_statistic = order_statistic
+        self.kwargs = kwargs
+
+    def __call__(self, window):
+        return self.func(window, **self.kwargs)
+
+def window_quantile(q, interpolation='linear'):
+    """
+    Make an aggregation for the quantile of each window, for use in the `agg_dict` of
+    `window_calc()`, which calculates it with `order_statistics()` for rolling and expanding
+    windows instead of calling it on every window.
+
+    Parameters:
+        - q: The quantile to calculate, between 0 and 1.
+        - interpolation: How to pick the value between two observations,
+          like in `pd.Series.quantile()`.
+
+    Returns:
+        A function that calculates the quantile of a window. It can be pickled,
+        so it also works with the processes of `grouped_window_calc()`.
+    """
+    return _WindowAggregation(
+        _quantile, f'quantile_{q:g}', ('quantile', q, interpolation), q=q, interpolation=interpolation
+    )
+
+def window_rank(method='average', ascending=True, pct=False):
+    """
+    Make an aggregation for the rank of the last value in each window, for use in the `agg_dict`
+    of `window_calc()`, which calculates it with `order_statistics()` for rolling and expanding
+    windows instead of calling it on every window.
+
+    Parameters:
+        - method: How to rank ties, either 'average', 'min', or 'max'.
+        - ascending: Whether the smallest value gets a rank of 1.
+        - pct: Whether to give the rank as a fraction of the observations in the window.
+
+    Returns:
+        A function that calculates the rank of the last value of a window. It can be
+        pickled, so it also works with the processes of `grouped_window_calc()`.
+    """
+    return _WindowAggregation(
+        _rank, 'pct_rank' if pct else 'rank', ('rank', method, ascending, pct),
+        method=method, ascending=ascending, pct=pct
+    )
+
+def _wavelet_matrix(codes, bits):
+    """
+    Build a wavelet matrix of distinct integer codes: for each bit (from the highest), the codes
+    are stably split into the ones without the bit followed by the ones with it, and the number
+    of codes without it before each position is kept, which is all that's needed to answer
+    questions about any range of the codes one bit at a time.
+    """
+    dtype = np.int32 if len(codes) < np.iinfo(np.int32).max else np.int64
+    levels = []
+    for bit in reversed(range(bits)):
+        has_bit = (codes >> bit) & 1
+        zeros = np.zeros(len(codes) + 1, dtype=dtype)
+        np.cumsum(1 - has_bit, out=zeros[1:])
+        levels.append(zeros)
+        codes = np.concatenate((codes[has_bit == 0], codes[has_bit == 1]))
+    return levels
+
+def _kth_smallest(levels, bits, starts, stops, k):
+    """Find the code of the `k`th smallest (from 0) of the codes in each range of positions of the wavelet matrix."""
+    code = np.zeros(len(k), dtype=np.int64)
+    for bit, zeros in zip(reversed(range(bits)), levels):
+        start_zeros, stop_zeros = zeros[starts], zeros[stops]
+        in_range = stop_zeros - start_zeros
+        # go to the codes with this bit when there aren't enough without it
+        with_bit = k >= in_range
+        starts = np.where(with_bit, zeros[-1] + starts - start_zeros, start_zeros)
+        stops = np.where(with_bit, zeros[-1] + stops - stop_zeros, stop_zeros)
+        k = np.where(with_bit, k - in_range, k)
+        code |= with_bit.astype(np.int64) << bit
+    return code
+
+def _count_less(levels, bits, starts, stops, codes):
+    """Count the codes smaller than `codes` in each range of positions of the wavelet matrix."""
+    count = np.zeros(len(codes), dtype=np.int64)
+    for bit, zeros in zip(reversed(range(bits)), levels):
+        start_zeros, stop_zeros = zeros[starts], zeros[stops]
+        # all the codes without the bit are smaller when the code has it
+        with_bit = ((codes >> bit) & 1).astype(bool)
+        count += np.where(with_bit, stop_zeros - start_zeros, 0)
+        starts = np.where(with_bit, zeros[-1] + starts - start_zeros, start_zeros)
+        stops = np.where(with_bit, zeros[-1] + stops - stop_zeros, stop_zeros)
+    return count
+
+def order_statistics(values, starts, min_periods, statistics):
+    """
+    Calculate order statistics (medians, quantiles, and ranks) of windows of an array,
+    ignoring NaNs like pandas does. Rather than keeping each window sorted as it slides, the
+    values are replaced by their position in sorted order and put in a wavelet matrix, which
+    answers "what is the kth smallest value?" and "how many values are smaller?" for all the
+    windows at once, one bit of the positions at a time, taking O(n log n) in total no matter
+    how big the windows are (and no Python calls per window).
+
+    Parameters:
+        - values: The array of values, in order.
+        - starts: The position where the window ending at each value starts.
+        - min_periods: The minimum number of observations a window needs to be calculated.
+        - statistics: A list of the statistics to calculate, either `('median',)`,
+          `('quantile', q, interpolation)`, or `('rank', method, ascending, pct)`.
+
+    Returns:
+        A list of arrays with the statistic for each window, one per statistic.
+    """
+    values = np.asarray(values, dtype=float)
+    size = len(values)
+    order = np.argsort(values, kind='stable')
+    sorted_values = values[order]
+    codes = np.empty(size, dtype=np.int64)
+    codes[order] = np.arange(size)
+    # enough bits for any count of values (NaNs get the biggest codes, so they're never reached)
+    bits = max(size.bit_length(), 1)
+    levels = _wavelet_matrix(codes, bits)
+
+    starts = np.asarray(starts, dtype=np.int64)
+    stops = np.arange(1, size + 1)
+    present = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(~np.isnan(values), out=present[1:])
+    count = present[1:] - present[starts]
+    invalid = count < max(min_periods, 1)
+    last = np.maximum(count - 1, 0)
+
+    def kth(k):
+        return sorted_values[_kth_smallest(levels, bits, starts, stops, np.clip(k, 0, last))]
+
+    results = []
+    for kind, *options in statistics:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if kind == 'median':
+                half = count // 2
+                upper = kth(half)
+                result = np.where(count % 2, upper, (kth(half - 1) + upper) / 2)
+            elif kind == 'quantile':
+                q, interpolation = options
+                position = q * (count - 1)
+                low = np.floor(position).astype(np.int64)
+                fraction = position - low
+                below, above = kth(low), kth(low + 1)
+                result = {
+                    'linear': below + (above - below) * fraction,
+                    'lower': below,
+                    'higher': above,
+                    'midpoint': (below + above) / 2,
+                    'nearest': np.where(
+                        fraction == 0.5, np.where(low % 2, above, below), np.where(fraction < 0.5, below, above)
+                    )
+                }[interpolation]
+                result = np.where(fraction == 0, below, result)
+            else:
+                method, ascending, pct = options
+                smaller = _count_less(
+                    levels, bits, starts, stops, np.searchsorted(sorted_values, values, side='left')
+                )
+                not_bigger = _count_less(
+                    levels, bits, starts, stops, np.searchsorted(sorted_values, values, side='right')
+                )
+                if not ascending:
+                    smaller, not_bigger = count - not_bigger, count - smaller
+                result = {
+                    'average': smaller + (not_bigger - smaller + 1) / 2,
+                    'min': smaller + 1.0,
+                    'max': not_bigger.astype(float)
+                }[method]
+                if pct:
+                    result = result / count
+                result = np.where(np.isnan(values), np.nan, result)
+        result[invalid] = np.nan
+        results.append(result)
+    return results
+
+def chunked_window_calc(source, out_file, func, agg_dict, *args, by=None, chunksize=100000, index_col=0,
+                        date_format=None, **kwargs):
+    """
+    Run a window calculation on data too big to fit in memory, reading it in chunks and writing
+    the results to a CSV file as they are calculated. Between chunks, `IncrementalWindowCalc`
+    carries over only what the window needs (the rows still in rolling windows, the running
+    totals of expanding ones, or the weighted averages of exponentially weighted ones), so memory
+    is bounded by the chunk size plus the window.
+
+    The results are only identical to those of `window_calc()` on all the data for aggregations
+    that pick values out of each window (min, max, median, count, and the quantiles and ranks of
+    `window_quantile()` and `window_rank()`). Aggregations calculated from running sums (sum,
+    mean, var, std, and exponentially weighted means) match to floating-point tolerance, but not
+    to the last digit: pandas' running sums depend on the row they start from, which differs
+    between the two.
+
+    Parameters:
+        - source: The CSV file to read, sorted by its index, or an iterable of
+          `DataFrame` objects in order (like a `pd.read_csv()` reader with a
+          `chunksize` and date parsing of your choice or the partitions of a
+          column store).
+        - out_file: The file to write the results to, in the same format as
+          calling `to_csv()` on the result of `window_calc()`.
+        - func: The window calculation method that takes `df`
+          as the first argument, like in `window_calc()`.
+        - agg_dict: Information to pass to `agg()`, like in `window_calc()`.
+        - args: Positional arguments to pass to `func`.
+        - by: Optional name of a column to run the calculation on each group of
+          separately, like in `grouped_window_calc()`.
+        - chunksize: The number of rows to read from the CSV file at a time.
+        - index_col: The column of the CSV file to use as the (datetime) index.
+        - date_format: The format of the datetimes in the index, for those that
+          pandas can't figure out, like '%Y-%m-%d %H-%M'.
+        - kwargs: Keyword arguments to pass to `func`.
+
+    Returns:
+        The number of rows written.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        source = pd.read_csv(source, index_col=index_col, parse_dates=date_format is None, chunksize=chunksize)
+
+    calcs = {}
+
+    def calculate(key, rows):
+        """Calculate the next rows of a group, starting its calculation if it's new."""
+        if key in calcs:
+            return calcs[key].update(rows)
+        calc = IncrementalWindowCalc(rows, func, agg_dict, *args, **kwargs)
+        if calc.mode == 'history':
+            raise ValueError(
+                f"{func.__name__}() with {agg_dict!r} needs the whole history, so it can't be calculated in chunks"
+            )
+        # only the columns are needed from here on
+        result, calc.result = calc.result, calc.result.iloc[:0]
+        calcs[key] = calc
+        return result
+
+    written, header = 0, True
+    for chunk in source:
+        if date_format is not None:
+            chunk.index = pd.to_datetime(chunk.index, format=date_format)
+        if by is None:
+            result = calculate(None, chunk)
+        else:
+            data = chunk.drop(columns=by)
+            results = [
+                (positions, calculate(key, data.iloc[positions]))
+                for key, positions in chunk.groupby(by, sort=False).indices.items()
+            ]
+            columns = (
+                results[0][1].columns if results
+                else window_calc(data.iloc[:0], func, agg_dict, *args, **kwargs).columns
+            )
+            # back in the order of the chunk (rows without a group are NaN)
+            values = np.full((len(chunk), len(columns)), np.nan)
+            for positions, group_result in results:
+                values[positions] = group_result.to_numpy(dtype=float)
+            result = pd.DataFrame(values, index=chunk.index, columns=columns)
+
+        result.to_csv(out_file, mode='w' if header else 'a', header=header)
+        header = False
+        written += len(result)
+    return written
@@ -0,0 +1,112 @@
+"""Script for benchmarking the hourly aggregation per IP address against the notebook's groupby-resample."""
+
+import argparse
+import logging
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from hourly_ip_logs import get_hourly_ip_logs
+
+# Logging configuration
+FORMAT = '[%(levelname)s] [ %(name)s ] %(message)s'
+logging.basicConfig(level=logging.INFO, format=FORMAT)
+logger = logging.getLogger(os.path.basename(__file__))
+
+def make_log(rows, ips=None, users=None, days=30, seed=0):
+    """
+    Make a synthetic login attempt log.
+
+    Parameters:
+        - rows: The number of login attempts.
+        - ips: The number of distinct IP addresses (defaults to 1 per 100 attempts).
+        - users: The number of distinct usernames (defaults to 1 per 200 attempts).
+        - days: The number of days the attempts are spread over.
+        - seed: The seed for the random number generator.
+
+    Returns:
+        A `pandas.DataFrame` shaped like `logs/log.csv`.
+    """
+    rng = np.random.default_rng(seed)
+    ips = ips or max(rows // 100, 10)
+    users = users or max(rows // 200, 10)
+
+    ip_pool = np.array([
+        f'{a}.{b}.{c}.{d}' for a, b, c, d in rng.integers(1, 255, size=(ips, 4))
+    ], dtype=object)
+    user_pool = np.array([f'user{i}' for i in range(users)], dtype=object)
+    offsets = np.sort(rng.integers(0, days * 24 * 3600 * 10**9, size=rows))
+
+    return pd.DataFrame({
+        'source_ip': ip_pool[rng.integers(0, ips, size=rows)],
+        'username': user_pool[rng.integers(0, users, size=rows)],
+        'success': rng.random(rows) < 0.8
+    }, index=pd.DatetimeIndex(pd.Timestamp('2018-01-01').value + offsets, name='datetime'))
+
+def groupby_resample(log):
+    """Aggregate the log per IP address and hour the way the notebook does."""
+    return log.assign(
+        failures=lambda x: np.invert(x.success)
+    ).groupby('source_ip').resample('1h').agg(
+        {'username': 'nunique', 'success': 'sum', 'failures': 'sum'}
+    ).assign(
+        attempts=lambda x: x.success + x.failures,
+        success_rate=lambda x: x.success / x.attempts,
+        failure_rate=lambda x: 1 - x.success_rate
+    ).dropna().reset_index()
+
+def time_call(func, *args):
+    """Run a function returning the result and the seconds it took."""
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+def run_benchmark(sizes, max_baseline_rows):
+    """
+    Time both ways of aggregating at each size, checking the results match.
+
+    Parameters:
+        - sizes: The numbers of rows to benchmark.
+        - max_baseline_rows: Only time the groupby-resample for logs up to this many rows.
+
+    Returns:
+        A `pandas.DataFrame` with the timings per size.
+    """
+    results = []
+    for rows in sizes:
+        log = make_log(rows)
+        logger.info(f'Aggregating {rows:,d} rows ({log.source_ip.nunique():,d} IP addresses)')
+        single_pass, single_pass_seconds = time_call(get_hourly_ip_logs, log)
+
+        baseline_seconds = np.nan
+        if rows <= max_baseline_rows:
+            baseline, baseline_seconds = time_call(groupby_resample, log)
+            pd.testing.assert_frame_equal(baseline, single_pass)
+        else:
+            logger.info('Skipping the groupby-resample (see --max-baseline-rows)')
+
+        results.append({
+            'rows': rows, 'groups': len(single_pass),
+            'groupby_resample_seconds': baseline_seconds,
+            'single_pass_seconds': single_pass_seconds,
+            'speedup': baseline_seconds / single_pass_seconds
+        })
+    return pd.DataFrame(results)
+
+if __name__ == '__main__':
+    # command line argument parsing
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '-s', '--sizes', type=int, nargs='+', default=[10_000, 1_000_000, 10_000_000],
+        help='numbers of rows to benchmark'
+    )
+    parser.add_argument(
+        '-m', '--max-baseline-rows', type=int, default=1_000_000,
+        help='largest log to run the (slow) groupby-resample on; it resamples every IP '
+             'address over the whole period, so its memory grows with IP addresses x hours'
+    )
+    args = parser.parse_args()
+
+    print(run_benchmark(args.sizes, args.max_baseline_rows).to_string(index=False))
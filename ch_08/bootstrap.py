@@ -0,0 +1,201 @@
+"""Utility functions for calculating hourly bootstrapped baselines of the aggregated logs."""
+
+import numpy as np
+import pandas as pd
+
+TRIM_COLUMNS = ['username', 'attempts', 'failure_rate']
+
+def trim(hourly_ip_logs, quantile, columns=TRIM_COLUMNS):
+    """
+    Remove rows with entries for any of the columns above the given quantile of their hour.
+    Equivalent to `groupby('hour').apply(lambda x: trim(x, quantile))` in the notebook
+    (rows come back ordered by hour), without splitting the data into groups.
+
+    Parameters:
+        - hourly_ip_logs: Aggregated hourly data per IP address.
+        - quantile: The quantile to use as the upper limit.
+        - columns: The columns to check.
+
+    Returns:
+        A `pandas.DataFrame` with the rows that were kept.
+    """
+    hours = hourly_ip_logs.datetime.dt.hour
+    limits = hourly_ip_logs[columns].groupby(hours).quantile(quantile).reindex(hours)
+    keep = (hourly_ip_logs[columns].to_numpy() <= limits.to_numpy()).all(axis=1)
+    order = np.argsort(hours.to_numpy(), kind='mergesort')
+    return hourly_ip_logs.iloc[order[keep[order]]].reset_index(drop=True)
+
+class HourlyBootstrap:
+    """
+    Bootstrap samples of each hour of the aggregated logs, drawn all at once so that any
+    number of statistics (and replicates) can be calculated without regrouping the data.
+
+    Parameters:
+        - hourly_ip_logs: Data to sample from.
+        - sample_size: The number of rows to sample (with replacement) per hour.
+        - replicates: The number of bootstrap samples to draw per hour.
+        - random_state: Seed (or `numpy.random.Generator`) for the sampling. With a seed and a
+                        single replicate, the samples are the same ones `DataFrame.sample()` picks
+                        in the notebook's `get_baselines()`.
+    """
+    def __init__(self, hourly_ip_logs, sample_size=10, replicates=1, random_state=0):
+        data = hourly_ip_logs.assign(hour=lambda x: x.datetime.dt.hour)
+        numeric = data.select_dtypes(include=['number', 'bool'])
+        self.columns = numeric.columns
+
+        order = np.argsort(data.hour.to_numpy(), kind='mergesort')
+        self.hours, counts = np.unique(data.hour.to_numpy()[order], return_counts=True)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+
+        positions = self._draw(counts, sample_size, replicates, random_state)
+        values = numeric.to_numpy(dtype=float)[order]
+        # shape: (replicates, hours, sample_size, columns)
+        self.samples = values[starts[np.newaxis, :, np.newaxis] + positions]
+        self._sorted = None
+
+    @staticmethod
+    def _draw(counts, sample_size, replicates, random_state):
+        """Draw the positions (within each hour) of the rows in every sample."""
+        if replicates == 1 and not isinstance(random_state, np.random.Generator):
+            # `DataFrame.sample()` starts every group with a fresh `RandomState`
+            return np.stack([
+                np.random.RandomState(random_state).randint(0, count, sample_size) for count in counts
+            ])[np.newaxis]
+
+        rng = np.random.default_rng(random_state)
+        uniform = rng.random((replicates, counts.size, sample_size))
+        return np.minimum(uniform * counts[:, np.newaxis], counts[:, np.newaxis] - 1).astype(np.int64)
+
+    @property
+    def sorted_samples(self):
+        """The samples sorted within each hour (sorted once, then shared by all quantiles)."""
+        if self._sorted is None:
+            self._sorted = np.sort(self.samples, axis=2)
+        return self._sorted
+
+    def quantiles(self, q):
+        """
+        Calculate quantiles of each sample with linear interpolation (like `DataFrame.quantile()`).
+
+        Parameters:
+            - q: A quantile or list of quantiles.
+
+        Returns:
+            A `numpy.ndarray` of shape (quantiles, replicates, hours, columns),
+            without the first dimension if `q` is a single quantile.
+        """
+        q = np.asarray(q, dtype=float)
+        position = q.reshape(-1) * (self.samples.shape[2] - 1)
+        below = np.floor(position).astype(int)
+        above = np.ceil(position).astype(int)
+        fraction = (position - below)[:, np.newaxis, np.newaxis, np.newaxis]
+
+        lower = np.moveaxis(self.sorted_samples[:, :, below], 2, 0)
+        upper = np.moveaxis(self.sorted_samples[:, :, above], 2, 0)
+        result = lower + (upper - lower) * fraction
+        return result if q.ndim else result[0]
+
+    def statistic(self, func, *args, **kwargs):
+        """
+        Calculate a statistic of each sample.
+
+        Parameters:
+            - func: 'mean', 'median', 'quantile', 'std', 'var', 'min', 'max', 'sum',
+                    or a function taking the samples and an `axis` argument.
+            - args: Additional positional arguments for `func` (like the quantile)
+            - kwargs: Additional keyword arguments for `func`
+
+        Returns:
+            A `numpy.ndarray` of shape (replicates, hours, columns).
+        """
+        if func == 'quantile':
+            return self.quantiles(*args, **kwargs)
+        if func == 'median':
+            return self.quantiles(0.5)
+        if func in ('std', 'var'):
+            # same default as pandas
+            kwargs.setdefault('ddof', 1)
+        if isinstance(func, str):
+            func = getattr(np, func)
+        return func(self.samples, *args, axis=2, **kwargs)
+
+    def to_frame(self, values):
+        """
+        Turn statistics of shape (replicates, hours, columns) into a `pandas.DataFrame` indexed by
+        the hour like the notebook's `get_baselines()`, with the replicate as an outer level if
+        there is more than one.
+        """
+        replicates, hours, columns = values.shape
+        if replicates == 1:
+            index = pd.Index(self.hours, name='hour')
+        else:
+            index = pd.MultiIndex.from_product([range(replicates), self.hours], names=['replicate', 'hour'])
+        return pd.DataFrame(values.reshape(-1, columns), index=index, columns=self.columns)
+
+    def baselines(self, func, *args, **kwargs):
+        """
+        Calculate hourly bootstrapped statistic per column.
+
+        Parameters:
+            - func: Statistic to calculate (see `statistic()`).
+            - args: Additional positional arguments for `func`
+            - kwargs: Additional keyword arguments for `func`
+
+        Returns:
+            `pandas.DataFrame` of hourly bootstrapped statistics
+        """
+        return self.to_frame(self.statistic(func, *args, **kwargs))
+
+    def tukey_fences(self, k, q1=0.25, q3=0.75):
+        """
+        Calculate the hourly Tukey fences from the same samples.
+
+        Parameters:
+            - k: The multiplier for the IQR
+            - q1: The quantile to use for the lower quartile.
+            - q3: The quantile to use for the upper quartile.
+
+        Returns:
+            A tuple of `pandas.DataFrame` objects: (lower bound, upper bound), which
+            have an `hour` column like the `upper_bound` in `tukey_fence_test()`.
+        """
+        lower, upper = self.quantiles([q1, q3])
+        iqr = upper - lower
+        return tuple(
+            self.to_frame(bound).drop(columns=['hour']).reset_index()
+            for bound in (lower - k * iqr, upper + k * iqr)
+        )
+
+def get_baselines(hourly_ip_logs, func, *args, sample_size=10, random_state=0, **kwargs):
+    """
+    Calculate hourly bootstrapped statistic per column (same as `get_baselines()` in the notebook).
+
+    Parameters:
+        - hourly_ip_logs: Data to sample from.
+        - func: Statistic to calculate.
+        - args: Additional positional arguments for `func`
+        - sample_size: The number of rows to sample per hour.
+        - random_state: Seed for the sampling.
+        - kwargs: Additional keyword arguments for `func`
+
+    Returns:
+        `pandas.DataFrame` of hourly bootstrapped statistics
+    """
+    return HourlyBootstrap(hourly_ip_logs, sample_size, random_state=random_state)\
+        .baselines(func, *args, **kwargs)
+
+def tukey_fence_bounds(trimmed_data, k, sample_size=10, random_state=0):
+    """
+    Calculate the upper bound `tukey_fence_test()` passes to `pct_change_threshold()`,
+    sampling once for both quartiles.
+
+    Parameters:
+        - trimmed_data: The data to use to calculate the baselines
+        - k: The multiplier for the IQR
+        - sample_size: The number of rows to sample per hour.
+        - random_state: Seed for the sampling.
+
+    Returns:
+        `pandas.DataFrame` of the hourly upper bounds.
+    """
+    return HourlyBootstrap(trimmed_data, sample_size, random_state=random_state).tukey_fences(k)[1]
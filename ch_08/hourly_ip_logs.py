@@ -0,0 +1,59 @@
+"""Utility functions for aggregating the login attempt logs per IP address and hour."""
+
+import numpy as np
+import pandas as pd
+
+def get_hourly_ip_logs(log):
+    """
+    Aggregate the logs per IP address and hour in a single pass. Produces the same result as
+    `log.assign(failures=...).groupby('source_ip').resample('1H').agg(...).assign(...).dropna().reset_index()`
+    from the notebook, without creating a resampler per IP address.
+
+    Parameters:
+        - log: The logs dataframe (with a `DatetimeIndex` and the `source_ip`,
+               `username`, and `success` columns)
+
+    Returns:
+        A `pandas.DataFrame` with a row per IP address and hour that had log in attempts, containing
+        the number of distinct usernames, successes, failures, attempts, and the success/failure rates.
+    """
+    datetime_col = log.index.name
+    ip_codes, ips = pd.factorize(log.source_ip, sort=True)
+    user_codes, _ = pd.factorize(log.username)
+    hours = log.index.floor('h')
+
+    # the groupby drops rows without an IP address
+    keep = ip_codes >= 0
+    ip_codes, user_codes = ip_codes[keep], user_codes[keep]
+    hours, success = hours[keep], log.success.to_numpy(dtype=bool)[keep]
+
+    # one sort puts the rows of each (IP address, hour) together with repeated usernames next to each other
+    hour_values = hours.to_numpy().view('i8')
+    order = np.lexsort((user_codes, hour_values, ip_codes))
+    ip_codes, hour_values, user_codes = ip_codes[order], hour_values[order], user_codes[order]
+
+    new_group = np.ones(order.size, dtype=bool)
+    new_group[1:] = (ip_codes[1:] != ip_codes[:-1]) | (hour_values[1:] != hour_values[:-1])
+    new_user = new_group.copy()
+    new_user[1:] |= user_codes[1:] != user_codes[:-1]
+    starts = np.flatnonzero(new_group)
+
+    if starts.size:
+        attempts = np.diff(np.append(starts, order.size))
+        successes = np.add.reduceat(success[order].astype(np.int64), starts)
+        # missing usernames don't count towards the distinct usernames
+        usernames = np.add.reduceat((new_user & (user_codes >= 0)).astype(np.int64), starts)
+    else:
+        attempts = successes = usernames = np.array([], dtype=np.int64)
+
+    return pd.DataFrame({
+        'source_ip': ips.take(ip_codes[starts]),
+        datetime_col: hours.take(order[starts]),
+        'username': usernames,
+        'success': successes,
+        'failures': attempts - successes,
+        'attempts': attempts
+    }).assign(
+        success_rate=lambda x: x.success / x.attempts,
+        failure_rate=lambda x: 1 - x.success_rate
+    )
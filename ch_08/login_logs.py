@@ -0,0 +1,107 @@
+"""Utility functions for loading login attempt logs with compact data types."""
+
+import ipaddress
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+def ip_to_uint32(ips):
+    """
+    Convert IPv4 addresses to unsigned 32-bit integers.
+
+    Parameters:
+        - ips: Array-like of IPv4 addresses as strings.
+
+    Returns:
+        A `numpy.ndarray` of `uint32` values.
+    """
+    # there are far fewer distinct addresses than attempts, so only parse each one once
+    codes, uniques = pd.factorize(np.asarray(ips, dtype=object))
+    return np.array(
+        [int(ipaddress.IPv4Address(ip)) for ip in uniques], dtype=np.uint32
+    )[codes]
+
+def uint32_to_ip(values):
+    """
+    Convert unsigned 32-bit integers back into IPv4 address strings.
+
+    Parameters:
+        - values: Array-like of `uint32` values.
+
+    Returns:
+        A `numpy.ndarray` of strings.
+    """
+    codes, uniques = pd.factorize(np.asarray(values))
+    return np.array([str(ipaddress.IPv4Address(int(value))) for value in uniques], dtype=object)[codes]
+
+def parse_datetimes(values):
+    """Parse datetimes using the fixed format of the logs (falling back to inferring it)."""
+    if pd.api.types.is_integer_dtype(values):
+        datetimes = pd.to_datetime(values, unit='ns') # nanoseconds since the epoch
+    else:
+        try:
+            datetimes = pd.to_datetime(values, format=DATETIME_FORMAT)
+        except ValueError:
+            datetimes = pd.to_datetime(values)
+    return datetimes.astype('datetime64[ns]')
+
+def memory_report(before, after):
+    """
+    Compare the memory used by each column of two versions of the same data.
+
+    Parameters:
+        - before: The `pandas.DataFrame` as it was read.
+        - after: The `pandas.DataFrame` with compact data types.
+
+    Returns:
+        A `pandas.DataFrame` with the data type and bytes used per column.
+    """
+    report = pd.DataFrame({
+        'dtype_before': before.dtypes.astype(str),
+        'bytes_before': before.memory_usage(deep=True, index=False),
+        'dtype_after': after.dtypes.astype(str),
+        'bytes_after': after.memory_usage(deep=True, index=False)
+    })
+    report.loc['total'] = [
+        '', report.bytes_before.sum(), '', report.bytes_after.sum()
+    ]
+    return report.assign(pct_of_before=lambda x: x.bytes_after / x.bytes_before)
+
+def load_logs(source, query='SELECT * FROM logs', report=True):
+    """
+    Load login attempt logs (datetime, source_ip, username, success, failure_reason)
+    with compact data types: IP addresses as `uint32` (see `uint32_to_ip()`), usernames and
+    failure reasons as categoricals, success as bool, and the datetime as the index.
+
+    Parameters:
+        - source: The path to a CSV file of the logs, or a `sqlite3.Connection` to read them from.
+        - query: The query to run when `source` is a database connection.
+        - report: Whether to print the memory used per column before and after the conversion.
+
+    Returns:
+        A `pandas.DataFrame` object.
+    """
+    if isinstance(source, sqlite3.Connection):
+        raw = pd.read_sql(query, source)
+    else:
+        raw = pd.read_csv(source)
+
+    success = raw.success
+    if pd.api.types.is_string_dtype(success):
+        success = success == 'True'
+
+    logs = pd.DataFrame({
+        'datetime': parse_datetimes(raw.datetime),
+        'source_ip': ip_to_uint32(raw.source_ip),
+        'username': raw.username.astype('category'),
+        'success': success.astype(bool),
+        'failure_reason': raw.failure_reason.astype('category')
+    })
+
+    if report:
+        print(memory_report(raw, logs).to_string())
+
+    return logs.set_index('datetime').sort_index()
@@ -1,18 +1,38 @@
 """Script for simulating login attempts."""
 
 import argparse
+from concurrent.futures import ProcessPoolExecutor
+import contextlib
+import cProfile
+import csv
 import datetime as dt
+import hashlib
+import heapq
+import json
 import os
 import logging
 import random
+import shutil
+import socket
+import sys
+import tempfile
+import time
+import tracemalloc
 
 import login_attempt_simulator as sim
 
+from vectorized_simulator import (
+    VectorizedLoginAttemptSimulator, assign_ip_addresses, is_binary_user_ips,
+    make_usernames, save_user_base, save_user_ips
+)
+
 # Logging configuration
 FORMAT = '[%(levelname)s] [ %(name)s ] %(message)s'
 logging.basicConfig(level=logging.INFO, format=FORMAT)
 logger = logging.getLogger(os.path.basename(__file__))
 
+ENGINES = ['python', 'vectorized']
+
 def get_simulation_file_path(path_provided, directory, default_file):
     """Get the path to the file creating the directory and using the default if necessary."""
     if path_provided:
@@ -23,14 +43,412 @@ def get_simulation_file_path(path_provided, directory, default_file):
         file = os.path.join(directory, default_file)
     return file
 
-def get_user_base_file_path(path_provided, default_file):
-    """Get the path for a user_data directory file."""
-    return get_simulation_file_path(path_provided, 'user_data', default_file)
+def get_user_base_file_path(path_provided, default_file, binary=False):
+    """
+    Get the path for a user_data directory file. With `binary`, the binary version of the
+    default file (the same path without the extension) is used instead if it exists.
+    """
+    file = get_simulation_file_path(path_provided, 'user_data', default_file)
+    binary_file = os.path.splitext(file)[0]
+    if binary and not path_provided and is_binary_user_ips(binary_file):
+        return binary_file
+    return file
 
 def get_log_file_path(path_provided, default_file):
     """Get the path for a logs directory file."""
     return get_simulation_file_path(path_provided, 'logs', default_file)
 
+class SimulationProfiler:
+    """
+    Record the wall time and the peak memory allocated (traced with `tracemalloc`) in each phase of the
+    simulation, optionally running `cProfile` during the phases as well. Phases that run more than once
+    (like once per window) add up their times and keep the highest peak.
+
+    Parameters:
+        - cprofile_file: The file to write the `cProfile` statistics to (readable with `pstats`).
+    """
+    def __init__(self, cprofile_file=None):
+        self.phases = {}
+        self.cprofile_file = cprofile_file
+        self._cprofile = cProfile.Profile() if cprofile_file else None
+        self._started = time.perf_counter()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Record the time and peak memory of the code run inside the `with` block as the phase."""
+        tracemalloc.start()
+        if self._cprofile:
+            self._cprofile.enable()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            if self._cprofile:
+                self._cprofile.disable()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.merge({name: {'seconds': seconds, 'peak_memory_mb': peak / 2**20, 'runs': 1}})
+
+    def merge(self, phases):
+        """Add the phases recorded by another profiler (like the one in each shard's process)."""
+        for name, stats in phases.items():
+            totals = self.phases.setdefault(name, {'seconds': 0, 'peak_memory_mb': 0, 'runs': 0})
+            totals['seconds'] += stats['seconds']
+            totals['peak_memory_mb'] = max(totals['peak_memory_mb'], stats['peak_memory_mb'])
+            totals['runs'] += stats['runs']
+
+    def save(self, summary_file, events, **settings):
+        """
+        Write the JSON summary of the phases (and the `cProfile` statistics if we were asked to).
+
+        Parameters:
+            - summary_file: The file to write the summary to.
+            - events: The number of login attempts simulated.
+            - settings: The settings of the simulation to include in the summary.
+
+        Returns:
+            The summary as a dictionary.
+        """
+        simulation_seconds = self.phases.get('simulation', {}).get('seconds')
+        summary = {
+            'settings': settings,
+            'total_seconds': time.perf_counter() - self._started,
+            'events': events,
+            'events_per_second': events / simulation_seconds if simulation_seconds else None,
+            'phases': self.phases
+        }
+        with open(summary_file, 'w') as file:
+            json.dump(summary, file, indent=2)
+        logger.info(f'Saved the profile to {summary_file}')
+
+        if self._cprofile:
+            self._cprofile.dump_stats(self.cprofile_file)
+            logger.info(f'Saved the cProfile statistics to {self.cprofile_file}')
+        return summary
+
+def profile_phase(profiler, name):
+    """Record the phase with the profiler (if we are profiling)."""
+    return profiler.phase(name) if profiler else contextlib.nullcontext()
+
+def count_rows(file):
+    """Count the rows of a CSV file (without the header)."""
+    with open(file, 'rb') as csv_file:
+        lines = sum(chunk.count(b'\n') for chunk in iter(lambda: csv_file.read(2**20), b''))
+    return max(lines - 1, 0)
+
+def get_shard_seed(seed, shard):
+    """Derive the seed for a shard from the seed for the whole simulation."""
+    if seed is None:
+        return None
+    return int.from_bytes(hashlib.sha256(f'{seed}-{shard}'.encode()).digest()[:4], 'big')
+
+def get_shard_windows(start, end, shards):
+    """Split the time between start and end into contiguous windows of equal length."""
+    step = (end - start) / shards
+    bounds = [start + step * shard for shard in range(shards)] + [end]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+def get_simulator_class(engine):
+    """Get the class that simulates the login attempts for the engine ('python' or 'vectorized')."""
+    if engine == 'python':
+        return sim.LoginAttemptSimulator
+    if engine == 'vectorized':
+        return VectorizedLoginAttemptSimulator
+    raise ValueError(f'`engine` must be one of {ENGINES}')
+
+def simulate_window(user_ip_mapping_file, start, end, seed, log_file, hack_log_file,
+                    engine='python', profiler=None, **kwargs):
+    """
+    Simulate login attempts between start and end, saving the logs to the files provided
+    (and recording the phases with the `SimulationProfiler` object, if provided).
+    Returns the phases the profiler recorded, so they can make it back from another process.
+    """
+    with profile_phase(profiler, 'simulation'):
+        simulator = get_simulator_class(engine)(user_ip_mapping_file, start, end, seed=seed)
+        simulator.simulate(**kwargs)
+    with profile_phase(profiler, 'hack_log_save'):
+        simulator.save_hack_log(hack_log_file)
+    with profile_phase(profiler, 'log_save'):
+        simulator.save_log(log_file)
+    return profiler.phases if profiler else None
+
+def merge_shard_files(files, sort_column, out_file):
+    """Combine the (sorted) files written by the shards into one file, keeping the rows in order."""
+    with contextlib.ExitStack() as stack:
+        readers = [csv.reader(stack.enter_context(open(file, 'r', newline=''))) for file in files]
+        headers = [next(reader, None) for reader in readers]
+        header = next(header for header in headers if header)
+        position = header.index(sort_column)
+        with open(out_file, 'w', newline='') as file:
+            writer = csv.writer(file, lineterminator='\n')
+            writer.writerow(header)
+            # ties go to the earlier shard
+            writer.writerows(heapq.merge(*readers, key=lambda row: row[position]))
+
+def simulate_shards(user_ip_mapping_file, start, end, shards, seed, log_file, hack_log_file,
+                    engine='python', profiler=None, **kwargs):
+    """
+    Simulate login attempts between start and end by splitting the time into
+    contiguous windows and simulating each one in its own process.
+
+    Parameters:
+        - user_ip_mapping_file: The file with the user-IP address map.
+        - start: The datetime to start the simulation at.
+        - end: The datetime to end the simulation at.
+        - shards: The number of windows to split the time into.
+        - seed: The seed for the simulation. Each window gets a seed derived from
+                this one and its position, so results are reproducible for the same
+                seed and number of shards.
+        - log_file: The file to write the attempt log to.
+        - hack_log_file: The file to write the hack log to.
+        - engine: 'python' for `LoginAttemptSimulator` or 'vectorized' for `VectorizedLoginAttemptSimulator`.
+        - profiler: A `SimulationProfiler` object to add the phases of every shard to (their times are
+                    summed across the processes) along with the merging of the files.
+        - kwargs: Additional keyword arguments for `LoginAttemptSimulator.simulate()`
+
+    Returns:
+        None
+    """
+    windows = get_shard_windows(start, end, shards)
+    with tempfile.TemporaryDirectory() as directory:
+        files = [
+            (os.path.join(directory, f'log_{shard}.csv'), os.path.join(directory, f'hack_log_{shard}.csv'))
+            for shard in range(shards)
+        ]
+        with ProcessPoolExecutor(max_workers=min(shards, os.cpu_count() or 1)) as executor:
+            futures = [
+                executor.submit(
+                    simulate_window, user_ip_mapping_file, window_start, window_end,
+                    get_shard_seed(seed, shard), shard_log_file, shard_hack_log_file, engine,
+                    SimulationProfiler() if profiler else None, **kwargs
+                )
+                for shard, ((window_start, window_end), (shard_log_file, shard_hack_log_file))
+                in enumerate(zip(windows, files))
+            ]
+            for future in futures:
+                phases = future.result()
+                if profiler:
+                    profiler.merge(phases)
+
+        with profile_phase(profiler, 'merge'):
+            merge_shard_files([hack_log for _, hack_log in files], 'start', hack_log_file)
+            merge_shard_files([log for log, _ in files], 'datetime', log_file)
+
+def get_flush_windows(start, end, flush_every):
+    """Split the time between start and end into consecutive windows (of at most `flush_every`)."""
+    bounds = []
+    current = start
+    while current < end:
+        bounds.append(current)
+        current += flush_every
+    return list(zip(bounds, bounds[1:] + [end]))
+
+def append_rows(file, out_file):
+    """Append the rows of a CSV file to another one, writing the header if it's the first time."""
+    with open(file, 'r', newline='') as source:
+        header = source.readline()
+        rows = source.read()
+    if rows:
+        with open(out_file, 'a', newline='') as destination:
+            if not destination.tell():
+                destination.write(header)
+            destination.write(rows)
+            destination.flush()
+            os.fsync(destination.fileno())
+
+def write_checkpoint(checkpoint, checkpoint_file):
+    """Save the checkpoint (replacing the previous one in a single step)."""
+    with open(f'{checkpoint_file}.tmp', 'w') as file:
+        json.dump(checkpoint, file, indent=2)
+    os.replace(f'{checkpoint_file}.tmp', checkpoint_file)
+
+def simulate_with_checkpoints(user_ip_mapping_file, start, end, flush_every, seed,
+                              log_file, hack_log_file, resume=False, stream=None, engine='python',
+                              profiler=None, **kwargs):
+    """
+    Simulate login attempts between start and end one window of time at a time, appending each window
+    to the log files as soon as it is done and saving a checkpoint, so only one window is ever held in
+    memory and an interrupted simulation can pick up where it left off.
+
+    Parameters:
+        - user_ip_mapping_file: The file with the user-IP address map.
+        - start: The datetime to start the simulation at.
+        - end: The datetime to end the simulation at.
+        - flush_every: The length of the windows as a `datetime.timedelta` object.
+        - seed: The seed for the simulation. Each window gets a seed derived from
+                this one and its position (which is all the random state we need to
+                save), so results are reproducible for the same seed and window length.
+        - log_file: The file to write the attempt log to.
+        - hack_log_file: The file to write the hack log to.
+        - resume: Whether to continue from the checkpoint of a previous run with the same settings.
+        - stream: An `EventStream` object to send each window's attempts to once it's written.
+        - engine: 'python' for `LoginAttemptSimulator` or 'vectorized' for `VectorizedLoginAttemptSimulator`.
+        - profiler: A `SimulationProfiler` object to record the phases of every window with.
+        - kwargs: Additional keyword arguments for `LoginAttemptSimulator.simulate()`
+
+    Returns:
+        None
+    """
+    checkpoint_file = f'{log_file}.checkpoint.json'
+    settings = {
+        'user_ip_mapping_file': os.path.abspath(user_ip_mapping_file),
+        'start': start.isoformat(), 'end': end.isoformat(), 'seed': seed,
+        'flush_every_hours': flush_every.total_seconds() / 3600, 'engine': engine,
+        'simulation_args': kwargs
+    }
+    checkpoint = {'settings': settings, 'windows_done': 0, 'clock': start.isoformat(), 'sizes': {}}
+
+    if resume and os.path.exists(checkpoint_file):
+        with open(checkpoint_file, 'r') as file:
+            saved = json.load(file)
+        if saved['settings'] != settings:
+            raise ValueError(
+                f'The checkpoint in {checkpoint_file} is for a simulation with different settings: '
+                f"{saved['settings']}"
+            )
+        checkpoint = saved
+        logger.info(f"Resuming the simulation at {checkpoint['clock']}")
+    elif resume:
+        logger.warning(f'No checkpoint found at {checkpoint_file}, starting from the beginning.')
+
+    # anything written after the last checkpoint will be simulated again
+    for file in [log_file, hack_log_file]:
+        if os.path.exists(file):
+            with open(file, 'r+') as output:
+                output.truncate(checkpoint['sizes'].get(file, 0))
+
+    windows = get_flush_windows(start, end, flush_every)
+    with tempfile.TemporaryDirectory() as directory:
+        window_log_file = os.path.join(directory, 'log.csv')
+        window_hack_log_file = os.path.join(directory, 'hack_log.csv')
+        for window in range(checkpoint['windows_done'], len(windows)):
+            window_start, window_end = windows[window]
+            logger.info(f'Simulating {window_start} to {window_end}')
+            simulate_window(
+                user_ip_mapping_file, window_start, window_end, get_shard_seed(seed, window),
+                window_log_file, window_hack_log_file, engine, profiler, **kwargs
+            )
+            with profile_phase(profiler, 'checkpoint'):
+                append_rows(window_hack_log_file, hack_log_file)
+                append_rows(window_log_file, log_file)
+            if stream:
+                with profile_phase(profiler, 'stream'):
+                    stream.send(window_log_file, window_start)
+
+            with profile_phase(profiler, 'checkpoint'):
+                checkpoint.update(
+                    windows_done=window + 1, clock=window_end.isoformat(),
+                    sizes={
+                        file: os.path.getsize(file) for file in [log_file, hack_log_file] if os.path.exists(file)
+                    }
+                )
+                write_checkpoint(checkpoint, checkpoint_file)
+
+        # write the header even if there was nothing to log
+        for file, window_file in [(log_file, window_log_file), (hack_log_file, window_hack_log_file)]:
+            if not os.path.exists(file) and os.path.exists(window_file):
+                shutil.copyfile(window_file, file)
+
+    os.remove(checkpoint_file)
+
+class EventStream:
+    """
+    Send the login attempts as newline-delimited JSON while the simulation runs, spacing
+    them out according to their simulated time. Writes block when the consumer falls behind,
+    so we slow down with it (nothing is dropped) and report how far behind the clock we got.
+
+    Parameters:
+        - target: 'stdout', 'pipe:<path>' for a named pipe (created if it doesn't exist),
+                  or 'tcp:<host>:<port>' for a consumer listening on a TCP socket.
+        - speed: How many simulated seconds pass per real second (0 to send as fast as possible).
+    """
+    def __init__(self, target, speed=1):
+        self.speed = speed
+        self._socket = None
+        if target == 'stdout':
+            self.file = sys.stdout
+        elif target.startswith('pipe:'):
+            path = target[len('pipe:'):]
+            if not os.path.exists(path):
+                os.mkfifo(path)
+            logger.info(f'Waiting for a reader to open {path}')
+            self.file = open(path, 'w')
+        elif target.startswith('tcp:'):
+            host, port = target[len('tcp:'):].rsplit(':', 1)
+            self._socket = socket.create_connection((host or 'localhost', int(port)))
+            self.file = self._socket.makefile('w')
+        else:
+            raise ValueError("The stream must be 'stdout', 'pipe:<path>', or 'tcp:<host>:<port>'")
+
+        self.events = 0
+        self.max_lag = 0
+        self.disconnected = False
+        self._clock = None
+
+    def send(self, log_file, start):
+        """
+        Send the login attempts in a log file.
+
+        Parameters:
+            - log_file: The CSV file with the attempts (sorted by datetime).
+            - start: The simulated datetime the file starts at; the clock starts
+                     here the first time something is sent.
+
+        Returns:
+            None
+        """
+        if self.disconnected:
+            return
+        if self._clock is None:
+            self._clock = (time.monotonic(), start)
+
+        started, simulation_start = self._clock
+        try:
+            with open(log_file, 'r', newline='') as file:
+                for row in csv.DictReader(file):
+                    if self.speed:
+                        due = started + (
+                            dt.datetime.fromisoformat(row['datetime']) - simulation_start
+                        ).total_seconds() / self.speed
+                        wait = due - time.monotonic()
+                        if wait > 0:
+                            self.file.flush()
+                            time.sleep(wait)
+                        else:
+                            self.max_lag = max(self.max_lag, -wait)
+
+                    record = {column: value if value != '' else None for column, value in row.items()}
+                    if 'success' in record:
+                        record['success'] = record['success'] == 'True'
+                    self.file.write(json.dumps(record) + '\n')
+                    self.events += 1
+            self.file.flush()
+        except (BrokenPipeError, ConnectionError):
+            logger.warning('The consumer disconnected, so the rest of the attempts will not be sent.')
+            self.disconnected = True
+
+    def close(self):
+        """Stop sending and report how the stream went."""
+        if self._clock is not None:
+            elapsed = time.monotonic() - self._clock[0]
+            logger.info(
+                f'Sent {self.events} attempts in {elapsed:.1f} seconds ({self.events / (elapsed or 1):.1f}/s), '
+                f'at most {self.max_lag:.3f} seconds behind the clock'
+            )
+        try:
+            if self.file is sys.stdout:
+                self.file.flush()
+            else:
+                self.file.close()
+        except (BrokenPipeError, ConnectionError):
+            pass
+        if self.disconnected and self.file is sys.stdout:
+            # keep Python from failing to flush standard output on exit
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        if self._socket:
+            self._socket.close()
+
 if __name__ == '__main__':
     # command line argument parsing
     parser = argparse.ArgumentParser()
@@ -59,25 +477,97 @@ if __name__ == '__main__':
     parser.add_argument(
         '-hl', '--hacklog', help='file to write the hack log to'
     )
+    parser.add_argument(
+        '-sh', '--shards', type=int, default=1,
+        help='number of time windows to simulate in parallel (each in its own process)'
+    )
+    parser.add_argument(
+        '-fe', '--flush-every', type=float,
+        help='hours to simulate at a time, appending them to the logs and saving a checkpoint after each'
+    )
+    parser.add_argument(
+        '-r', '--resume', action='store_true',
+        help='continue an interrupted --flush-every simulation from its last checkpoint'
+    )
+    parser.add_argument(
+        '-o', '--stream',
+        help="also send the attempts as JSON lines to 'stdout', 'pipe:<path>', or 'tcp:<host>:<port>'"
+    )
+    parser.add_argument(
+        '-x', '--speed', type=float, default=1,
+        help='simulated seconds per real second when streaming (0 for as fast as possible)'
+    )
+    parser.add_argument(
+        '-e', '--engine', choices=ENGINES, default='python',
+        help="how to generate the attempts: one event at a time ('python') or in NumPy batches ('vectorized', "
+             "with the same yearly rates but not the same logs; see vectorized_simulator.py)"
+    )
+    parser.add_argument(
+        '-n', '--users', type=int,
+        help='number of users to make with --make (requires --engine vectorized)'
+    )
+    parser.add_argument(
+        '-p', '--profile', nargs='?', const='',
+        help='record the time and peak memory of each phase (slowing them down), writing a JSON summary '
+        'to this file (defaults to the log file with .profile.json appended)'
+    )
+    parser.add_argument(
+        '-cp', '--cprofile', help='also run cProfile during --profile, writing the statistics to this file'
+    )
     args = parser.parse_args()
-    user_ip_mapping_file = get_user_base_file_path(args.ip, 'user_ips.json')
+    if args.shards < 1:
+        parser.error('--shards must be at least 1')
+    if args.flush_every is not None and args.flush_every <= 0:
+        parser.error('--flush-every must be positive')
+    if args.flush_every and args.shards > 1:
+        parser.error('--flush-every and --shards cannot be combined')
+    if args.resume and not args.flush_every:
+        parser.error('--resume requires --flush-every')
+    if args.resume and args.make:
+        parser.error('--resume cannot be combined with --make')
+    if args.speed < 0:
+        parser.error('--speed cannot be negative')
+    if args.users is not None and (not args.make or args.engine != 'vectorized'):
+        parser.error('--users requires --make and --engine vectorized')
+    if args.users is not None and args.users < 1:
+        parser.error('--users must be at least 1')
+    if args.cprofile and args.profile is None:
+        parser.error('--cprofile requires --profile')
+    if args.engine == 'python' and args.ip and is_binary_user_ips(args.ip):
+        parser.error('the binary user-IP address map requires --engine vectorized')
+    # the vectorized engine can read the binary user-IP address map, so it uses that one if it's there
+    user_ip_mapping_file = get_user_base_file_path(args.ip, 'user_ips.json', binary=args.engine == 'vectorized')
+    profiler = SimulationProfiler(args.cprofile) if args.profile is not None else None
 
     if args.make:
         logger.warning('Creating new user base and mapping IP addresses to them.')
 
         user_base_file = get_user_base_file_path(args.userbase, 'user_base.txt')
 
-        # seed the creation of user base
-        random.seed(args.seed)
+        if args.engine == 'vectorized':
+            # make them all at once, saving the map as binary unless a JSON file was asked for
+            with profile_phase(profiler, 'user_base'):
+                usernames = make_usernames(args.users)
+                save_user_base(usernames, user_base_file)
+            with profile_phase(profiler, 'ip_assignment'):
+                offsets, ips = assign_ip_addresses(usernames.size, args.seed)
+                if not args.ip:
+                    user_ip_mapping_file = os.path.splitext(user_ip_mapping_file)[0]
+                save_user_ips(usernames, offsets, ips, user_ip_mapping_file)
+        else:
+            with profile_phase(profiler, 'user_base'):
+                # seed the creation of user base
+                random.seed(args.seed)
 
-        # create usernames and write to file
-        sim.utils.make_user_base(user_base_file)
+                # create usernames and write to file
+                sim.utils.make_user_base(user_base_file)
 
-        # create one or more IP addresses per user and save mapping to file
-        valid_users = sim.utils.get_valid_users(user_base_file)
-        sim.utils.save_user_ips(
-            sim.utils.assign_ip_addresses(valid_users), user_ip_mapping_file
-        )
+            with profile_phase(profiler, 'ip_assignment'):
+                # create one or more IP addresses per user and save mapping to file
+                valid_users = sim.utils.get_valid_users(user_base_file)
+                sim.utils.save_user_ips(
+                    sim.utils.assign_ip_addresses(valid_users), user_ip_mapping_file
+                )
 
     try:
         start = dt.datetime(*map(int, args.start_date.split('-')))
@@ -93,19 +583,56 @@ if __name__ == '__main__':
 
     end = start + dt.timedelta(days=args.days)
 
+    stream = EventStream(args.stream, args.speed) if args.stream else None
+
     try:
         logger.info(f'Simulating {args.days} days...')
-        simulator = sim.LoginAttemptSimulator(
-            user_ip_mapping_file, start, end, seed=args.seed
-        )
-        simulator.simulate(attack_prob=0.1, try_all_users_prob=0.2, vary_ips=False)
+        simulation_args = dict(attack_prob=0.1, try_all_users_prob=0.2, vary_ips=False)
+        if args.flush_every:
+            simulate_with_checkpoints(
+                user_ip_mapping_file, start, end, dt.timedelta(hours=args.flush_every), args.seed,
+                get_log_file_path(args.log, 'log.csv'),
+                get_log_file_path(args.hacklog, 'attacks.csv'),
+                resume=args.resume, stream=stream, engine=args.engine, profiler=profiler, **simulation_args
+            )
+        elif args.shards > 1:
+            logger.info(f'Splitting the simulation into {args.shards} shards')
+            simulate_shards(
+                user_ip_mapping_file, start, end, args.shards, args.seed,
+                get_log_file_path(args.log, 'log.csv'),
+                get_log_file_path(args.hacklog, 'attacks.csv'),
+                engine=args.engine, profiler=profiler, **simulation_args
+            )
+        else:
+            with profile_phase(profiler, 'simulation'):
+                simulator = get_simulator_class(args.engine)(
+                    user_ip_mapping_file, start, end, seed=args.seed
+                )
+                simulator.simulate(**simulation_args)
+
+            # save logs
+            logger.info('Saving logs')
+            with profile_phase(profiler, 'hack_log_save'):
+                simulator.save_hack_log(get_log_file_path(args.hacklog, 'attacks.csv'))
+            with profile_phase(profiler, 'log_save'):
+                simulator.save_log(get_log_file_path(args.log, 'log.csv'))
+
+        if stream and not args.flush_every:
+            with profile_phase(profiler, 'stream'):
+                stream.send(get_log_file_path(args.log, 'log.csv'), start)
 
-        # save logs
-        logger.info('Saving logs')
-        simulator.save_hack_log(get_log_file_path(args.hacklog, 'attacks.csv'))
-        simulator.save_log(get_log_file_path(args.log, 'log.csv'))
+        if profiler:
+            log_file = get_log_file_path(args.log, 'log.csv')
+            profiler.save(
+                args.profile or f'{log_file}.profile.json', count_rows(log_file),
+                days=args.days, start=start.isoformat(), seed=args.seed, engine=args.engine,
+                shards=args.shards, flush_every=args.flush_every, users=args.users, **simulation_args
+            )
 
         logger.info('All done!')
     except:
         logger.error('Oops! Something went wrong...')
         raise
+    finally:
+        if stream:
+            stream.close()
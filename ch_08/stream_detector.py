@@ -0,0 +1,305 @@
+"""Script for detecting suspicious IP addresses as login attempts are appended to a log file."""
+
+import argparse
+import collections
+import csv
+import datetime as dt
+import json
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from bootstrap import get_baselines, trim, tukey_fence_bounds
+from hourly_ip_logs import get_hourly_ip_logs
+
+# Logging configuration
+FORMAT = '[%(levelname)s] [ %(name)s ] %(message)s'
+logging.basicConfig(level=logging.INFO, format=FORMAT)
+logger = logging.getLogger(os.path.basename(__file__))
+
+COLUMNS = ['username', 'attempts', 'failure_rate']
+RULES = ['pct', 'tukey', 'z']
+
+def get_thresholds(hourly_ip_logs, rule='tukey', *, k=3, cutoff=3, pct=1, statistic='mean', trim_quantile=0.95):
+    """
+    Calculate the values of the distinct usernames, attempts, and failure rate an IP address
+    has to reach in an hour to get flagged, using the rules from the notebook.
+
+    Parameters:
+        - hourly_ip_logs: Aggregated hourly data per IP address to calculate the baselines from.
+        - rule: 'pct' for `pct_change_threshold()`, 'tukey' for `tukey_fence_test()`,
+                or 'z' for `z_score_test()`.
+        - k: The multiplier for the IQR (Tukey fence).
+        - cutoff: The Z-score to flag at.
+        - pct: The percentage of the baseline to flag at (percent change and Tukey fence).
+        - statistic: The statistic to use as the baseline for the percent change.
+        - trim_quantile: The quantile to trim the data at for the Tukey fence and Z-score.
+
+    Returns:
+        A `pandas.DataFrame` with a row per hour of the day (hours without
+        any baseline get thresholds of infinity, so they are never flagged).
+    """
+    if rule == 'pct':
+        thresholds = get_baselines(hourly_ip_logs, statistic)[COLUMNS] * pct
+    elif rule == 'tukey':
+        thresholds = tukey_fence_bounds(
+            trim(hourly_ip_logs, trim_quantile), k
+        ).set_index('hour')[COLUMNS] * pct
+    elif rule == 'z':
+        trimmed = trim(hourly_ip_logs, trim_quantile)
+        std_dev = get_baselines(trimmed, 'std')[COLUMNS]
+        averages = get_baselines(trimmed, 'mean')[COLUMNS]
+        # dividing by a standard deviation of zero only gives a Z-score above the cutoff when above the mean
+        thresholds = (averages + cutoff * std_dev).mask(std_dev == 0, np.nextafter(averages, np.inf))
+    else:
+        raise ValueError(f'`rule` must be one of {RULES}')
+    return thresholds.reindex(range(24), fill_value=np.inf)
+
+class StreamingDetector:
+    """
+    Keep the counts for the current hour of every IP address in arrays and flag
+    an IP address as soon as it crosses all the thresholds for that hour.
+
+    Note that the failure rate can go back down before the hour is over, so an IP address
+    can get flagged here when the same rule applied to the full hour (in the notebook) would not.
+
+    Parameters:
+        - thresholds: The thresholds per hour of the day (see `get_thresholds()`).
+        - capacity: The number of IP addresses to make room for initially.
+    """
+    def __init__(self, thresholds, capacity=1024):
+        self.thresholds = thresholds[COLUMNS].to_numpy(dtype=float)
+        self.slots = {}
+        self.hour = np.full(capacity, -1, dtype=np.int64)
+        self.attempts = np.zeros(capacity, dtype=np.int32)
+        self.successes = np.zeros(capacity, dtype=np.int32)
+        self.alerted = np.zeros(capacity, dtype=bool)
+        self.usernames = []
+        self.late_events = 0
+        self._last_hour = (None, None)
+
+    def _get_slot(self, source_ip):
+        """Find the position of the IP address in the arrays, making room for new ones."""
+        slot = self.slots.get(source_ip)
+        if slot is None:
+            slot = self.slots[source_ip] = len(self.slots)
+            self.usernames.append(set())
+            if slot == self.hour.size:
+                for name in ['hour', 'attempts', 'successes', 'alerted']:
+                    array = getattr(self, name)
+                    grown = np.zeros(array.size * 2, dtype=array.dtype)
+                    grown[:array.size] = array
+                    setattr(self, name, grown)
+                self.hour[slot:] = -1
+        return slot
+
+    def _get_hour(self, datetime):
+        """Get the hour (since the epoch) and hour of the day of a datetime string."""
+        prefix = datetime[:13]
+        if prefix != self._last_hour[0]:
+            hour = dt.datetime.strptime(prefix, '%Y-%m-%d %H')
+            self._last_hour = (prefix, (
+                int(hour.replace(tzinfo=dt.timezone.utc).timestamp()) // 3600, hour.hour
+            ))
+        return self._last_hour[1]
+
+    def process(self, datetime, source_ip, username, success):
+        """
+        Add a login attempt to the state of its IP address.
+
+        Parameters:
+            - datetime: The datetime of the attempt as a string ('YYYY-MM-DD HH:MM:SS...')
+            - source_ip: The IP address the attempt came from.
+            - username: The username of the attempt.
+            - success: Whether the attempt was successful.
+
+        Returns:
+            A dictionary describing the alert if this attempt made the IP address
+            cross the thresholds, otherwise `None`.
+        """
+        hour, hour_of_day = self._get_hour(datetime)
+        slot = self._get_slot(source_ip)
+
+        if hour > self.hour[slot]:
+            self.hour[slot] = hour
+            self.attempts[slot] = self.successes[slot] = 0
+            self.alerted[slot] = False
+            self.usernames[slot] = set()
+        elif hour < self.hour[slot]:
+            # the hour this belongs to has already been replaced
+            self.late_events += 1
+            return None
+
+        self.attempts[slot] += 1
+        self.successes[slot] += success
+        self.usernames[slot].add(username)
+        if self.alerted[slot]:
+            return None
+
+        attempts = int(self.attempts[slot])
+        values = (len(self.usernames[slot]), attempts, 1 - self.successes[slot] / attempts)
+        if all(value >= threshold for value, threshold in zip(values, self.thresholds[hour_of_day])):
+            self.alerted[slot] = True
+            return {
+                'datetime': datetime, 'source_ip': source_ip,
+                **dict(zip(COLUMNS, (values[0], values[1], float(values[2]))))
+            }
+        return None
+
+def follow(file, poll_interval=0.5, keep_following=True):
+    """
+    Yield the complete lines of a file, including the ones appended to it after we reach the end.
+
+    Parameters:
+        - file: The file to read.
+        - poll_interval: The seconds to wait before checking for new lines at the end of the file.
+        - keep_following: Whether to wait for new lines at the end of the file (otherwise stop).
+
+    Returns:
+        A generator of lines.
+    """
+    with open(file, 'r', newline='') as log_file:
+        partial = ''
+        while True:
+            line = log_file.readline()
+            if not line:
+                if not keep_following:
+                    break
+                time.sleep(poll_interval)
+                continue
+            if not line.endswith('\n'):
+                # the writer hasn't finished this line yet
+                partial += line
+                continue
+            yield partial + line
+            partial = ''
+        if partial:
+            yield partial
+
+class LatencyTracker:
+    """
+    Track the time between reading each event and finishing with it.
+
+    Parameters:
+        - window: The number of recent events to calculate the percentiles from.
+    """
+    def __init__(self, window=100000):
+        self.latencies = collections.deque(maxlen=window)
+        self.events = 0
+        self.alerts = 0
+        self.started = time.perf_counter()
+
+    def add(self, latency, alerted=False):
+        """Record the latency (in seconds) of an event."""
+        self.latencies.append(latency)
+        self.events += 1
+        self.alerts += alerted
+
+    def summary(self):
+        """Summarize the throughput and latencies (in milliseconds)."""
+        latencies = np.array(self.latencies) * 1000
+        elapsed = time.perf_counter() - self.started
+        return {
+            'events': self.events, 'alerts': self.alerts,
+            'events_per_second': self.events / elapsed if elapsed else np.nan,
+            **{
+                f'latency_ms_{name}': float(np.percentile(latencies, q)) if latencies.size else np.nan
+                for name, q in [('p50', 50), ('p99', 99), ('max', 100)]
+            }
+        }
+
+def detect(log_file, detector, output=sys.stdout, poll_interval=0.5, keep_following=True, report_every=60):
+    """
+    Run the detector over the log file as it grows, writing alerts as JSON lines.
+
+    Parameters:
+        - log_file: The CSV file of login attempts to follow.
+        - detector: The `StreamingDetector` object.
+        - output: The file object to write the alerts to.
+        - poll_interval: The seconds to wait before checking for new lines at the end of the file.
+        - keep_following: Whether to wait for new lines at the end of the file (otherwise stop).
+        - report_every: The seconds between logging the latency summary.
+
+    Returns:
+        The final latency summary as a dictionary.
+    """
+    tracker = LatencyTracker()
+    last_report = time.perf_counter()
+    lines = follow(log_file, poll_interval, keep_following)
+    header = next(csv.reader([next(lines)]))
+    position = {column: header.index(column) for column in ['datetime', 'source_ip', 'username', 'success']}
+
+    try:
+        for line in lines:
+            read_at = time.perf_counter()
+            row = next(csv.reader([line]))
+            alert = detector.process(
+                row[position['datetime']], row[position['source_ip']],
+                row[position['username']], row[position['success']] == 'True'
+            )
+            if alert:
+                alert['latency_ms'] = (time.perf_counter() - read_at) * 1000
+                print(json.dumps(alert), file=output, flush=True)
+            tracker.add(time.perf_counter() - read_at, alert is not None)
+
+            if time.perf_counter() - last_report >= report_every:
+                logger.info(json.dumps(tracker.summary()))
+                last_report = time.perf_counter()
+    except KeyboardInterrupt:
+        logger.info('Stopped following the log')
+
+    summary = tracker.summary()
+    logger.info(json.dumps(summary))
+    if detector.late_events:
+        logger.warning(f'Skipped {detector.late_events} attempts that arrived after their hour was over')
+    return summary
+
+if __name__ == '__main__':
+    # command line argument parsing
+    parser = argparse.ArgumentParser()
+    parser.add_argument('log', help='the log file to follow (like logs/log.csv)')
+    parser.add_argument(
+        '-H', '--history', required=True,
+        help='log file to calculate the hourly baselines from'
+    )
+    parser.add_argument(
+        '-r', '--rule', choices=RULES, default='tukey', help='rule to flag IP addresses with'
+    )
+    parser.add_argument('-k', type=float, default=3, help='IQR multiplier for the Tukey fence')
+    parser.add_argument('-z', '--cutoff', type=float, default=3, help='Z-score cutoff')
+    parser.add_argument(
+        '-p', '--pct', type=float, default=1, help='percentage of the baseline to flag at'
+    )
+    parser.add_argument(
+        '-s', '--statistic', default='mean', help='baseline statistic for the percent change rule'
+    )
+    parser.add_argument(
+        '-f', '--follow', action='store_true',
+        help='keep waiting for new attempts at the end of the file (like tail -f)'
+    )
+    parser.add_argument(
+        '-i', '--interval', type=float, default=0.5,
+        help='seconds to wait before checking the file for new attempts'
+    )
+    parser.add_argument(
+        '-o', '--output', help='file to write the alerts to (defaults to standard output)'
+    )
+    args = parser.parse_args()
+
+    logger.info(f'Calculating the {args.rule} thresholds from {args.history}')
+    history = pd.read_csv(args.history, index_col='datetime', parse_dates=True)
+    thresholds = get_thresholds(
+        get_hourly_ip_logs(history), args.rule,
+        k=args.k, cutoff=args.cutoff, pct=args.pct, statistic=args.statistic
+    )
+
+    output = open(args.output, 'a') if args.output else sys.stdout
+    try:
+        detect(args.log, StreamingDetector(thresholds), output, args.interval, args.follow)
+    finally:
+        if args.output:
+            output.close()
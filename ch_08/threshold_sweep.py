@@ -0,0 +1,133 @@
+"""Utility functions for evaluating the rule-based detectors over many thresholds at once."""
+
+import numpy as np
+import pandas as pd
+
+from bootstrap import HourlyBootstrap
+
+COLUMNS = ['username', 'attempts', 'failure_rate']
+
+def _hourly_values(hourly_ip_logs, baselines):
+    """Line up the columns with the baselines for the hour of each row."""
+    hours = hourly_ip_logs.datetime.dt.hour
+    return (
+        hourly_ip_logs[COLUMNS].to_numpy(dtype=float),
+        baselines[COLUMNS].reindex(hours).to_numpy(dtype=float)
+    )
+
+def _ip_scores(hourly_ip_logs, column_scores):
+    """
+    Reduce the scores per column to a score per IP address: a row only gets flagged if all of its columns
+    do (the minimum) and an IP address gets flagged if any of its rows do (the maximum).
+    """
+    with np.errstate(invalid='ignore'):
+        row_scores = np.min(column_scores, axis=1)
+    # comparisons involving NaN are never true, so these rows never get flagged
+    row_scores[np.isnan(row_scores)] = -np.inf
+    return pd.Series(row_scores, index=hourly_ip_logs.source_ip.to_numpy())\
+        .groupby(level=0).max().rename('score')
+
+def pct_change_scores(hourly_ip_logs, baselines):
+    """
+    Calculate the largest `pct` at which `pct_change_threshold()` flags each IP address.
+
+    Parameters:
+        - hourly_ip_logs: Aggregated hourly data per IP address.
+        - baselines: Hourly baselines per column in data.
+
+    Returns:
+        `pandas.Series` of scores indexed by IP address.
+    """
+    values, baselines = _hourly_values(hourly_ip_logs, baselines)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # a baseline of zero is below any value (all of which are non-negative)
+        ratios = np.where(baselines == 0, np.inf, values / baselines)
+    return _ip_scores(hourly_ip_logs, ratios)
+
+def tukey_fence_scores(trimmed_data, logs, pct=None, sample_size=10, random_state=0):
+    """
+    Calculate the largest `k` at which `tukey_fence_test()` flags each IP address,
+    getting both quartiles from the same bootstrap samples.
+
+    Parameters:
+        - trimmed_data: The data to use to calculate the baselines
+        - logs: The data to test
+        - pct: Dictionary of percentages per column for use with `pct_change_threshold()`
+        - sample_size: The number of rows to sample per hour.
+        - random_state: Seed for the sampling.
+
+    Returns:
+        `pandas.Series` of scores indexed by IP address.
+    """
+    pcts = pd.Series({column: (pct or {}).get(column, 1) for column in COLUMNS})
+    bootstrap = HourlyBootstrap(trimmed_data, sample_size, random_state=random_state)
+    q1, q3 = (bootstrap.to_frame(quantile) for quantile in bootstrap.quantiles([0.25, 0.75]))
+
+    values, upper = _hourly_values(logs, q3)
+    _, lower = _hourly_values(logs, q1)
+    iqr = upper - lower
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # (q3 + k * iqr) * pct <= x
+        distance = values / pcts.to_numpy() - upper
+        multiples = np.where(iqr == 0, np.where(distance >= 0, np.inf, -np.inf), distance / iqr)
+    return _ip_scores(logs, multiples)
+
+def z_score_scores(trimmed_data, logs, sample_size=10, random_state=0):
+    """
+    Calculate the largest cutoff at which `z_score_test()` flags each IP address.
+
+    Parameters:
+        - trimmed_data: The data to use to calculate the baselines
+        - logs: The data to test
+        - sample_size: The number of rows to sample per hour.
+        - random_state: Seed for the sampling.
+
+    Returns:
+        `pandas.Series` of scores indexed by IP address.
+    """
+    bootstrap = HourlyBootstrap(trimmed_data, sample_size, random_state=random_state)
+    values, averages = _hourly_values(logs, bootstrap.baselines('mean'))
+    _, std_dev = _hourly_values(logs, bootstrap.baselines('std'))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return _ip_scores(logs, (values - averages) / std_dev)
+
+def sweep(scores, thresholds, attack_ips, log_ips):
+    """
+    Calculate what `evaluate()` and `classification_stats()` would give for every threshold,
+    flagging the IP addresses with a score greater than or equal to the threshold.
+
+    Parameters:
+        - scores: `pandas.Series` of scores indexed by IP address (from one of the `*_scores()` functions)
+        - thresholds: The values of `pct`, `k`, or the cutoff to evaluate.
+        - attack_ips: `pandas.Series` of attacker IP addresses
+        - log_ips: `pandas.Series` of all IP addresses seen
+
+    Returns:
+        `pandas.DataFrame` with TP, FP, TN, FN, FPR, FDR, FNR, and FOR per threshold.
+    """
+    thresholds = np.asarray(thresholds, dtype=float)
+    attack_ips = pd.Series(attack_ips)
+    is_attacker = scores.index.isin(attack_ips)
+
+    def count_flagged(values):
+        """Count the scores that are at or above each threshold."""
+        values = np.sort(values)
+        return values.size - np.searchsorted(values, thresholds, side='left')
+
+    tp = count_flagged(scores[is_attacker].to_numpy())
+    fp = count_flagged(scores[~is_attacker].to_numpy())
+    # attacker IP addresses are counted as often as they appear, like in `evaluate()`
+    fn = attack_ips.size - count_flagged(scores.reindex(attack_ips, fill_value=-np.inf).to_numpy())
+
+    log_ips = pd.Series(pd.unique(pd.Series(log_ips)))
+    innocent = log_ips[~log_ips.isin(attack_ips)]
+    tn = innocent.size - count_flagged(scores.reindex(innocent, fill_value=-np.inf).to_numpy())
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return pd.DataFrame({
+            'TP': tp, 'FP': fp, 'TN': tn, 'FN': fn,
+            'FPR': fp / (fp + tn),
+            'FDR': fp / (fp + tp),
+            'FNR': fn / (fn + tp),
+            'FOR': fn / (fn + tn)
+        }, index=pd.Index(thresholds, name='threshold'))
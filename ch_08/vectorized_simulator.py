@@ -0,0 +1,394 @@
+"""Vectorized simulation of login attempts, drawing the random numbers in NumPy batches."""
+
+import ipaddress
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+HOUR = 3600 * 10**6 # in microseconds
+SECOND = 10**6
+
+# the parameters are fit to the logs of `login_attempt_simulator` in the `logs/` directory
+VALID_USER_ARRIVALS = 3 # Poisson rate per hour (so exponential interarrival times with rate 3)
+VALID_USER_SUCCESS = (0.87, 0.93, 0.95) # likelihood of typing the password right on each attempt before the lockout
+VALID_USER_PAUSE = SECOND # time before trying again
+USERNAME_TYPO_PROB = 0.0007 # probability of mistyping the username on the first attempt (and fixing it for the next)
+ATTEMPTS_BEFORE_LOCKOUT = len(VALID_USER_SUCCESS)
+UNLOCK_PROB = 2 / 3 # probability that a user who finds their account locked gets it unlocked for next time
+
+HACKER_SUCCESS = (0.25, 0.45) # likelihood of guessing the password on each attempt at a username
+HACKER_GUESS_USERNAME_PROB = 0.53 # probability of starting with a username variation that doesn't exist
+HACKER_FIX_USERNAME_PROB = 0.2 # probability of trying the real username after the variation fails
+HACKER_PAUSE = SECOND
+
+FAILURE_REASONS = ['error_wrong_password', 'error_wrong_username', 'error_account_locked']
+WRONG_PASSWORD, WRONG_USERNAME, ACCOUNT_LOCKED = range(len(FAILURE_REASONS))
+
+# the user base of `login_attempt_simulator.utils.make_user_base()`
+FIRST_INITIALS = 'abcdefghijklmnopqrstuvwxyz'
+LAST_NAMES = ['smith', 'jones', 'kim', 'lopez', 'brown']
+ADMIN_USERNAMES = ['admin', 'master', 'dba']
+MAX_IPS_PER_USER = 3
+
+# files in the directory of a binary user-IP address map
+BINARY_USER_IP_FILES = {'usernames': 'usernames.npy', 'offsets': 'offsets.npy', 'ips': 'ips.npy'}
+
+def ip_to_uint32(ips):
+    """Convert IP addresses to unsigned 32-bit integers (parsing each distinct address once)."""
+    codes, uniques = pd.factorize(np.asarray(ips, dtype=object))
+    return np.array([int(ipaddress.IPv4Address(ip)) for ip in uniques], dtype=np.uint32)[codes]
+
+OCTETS = np.array([str(octet) for octet in range(256)], dtype=object)
+
+def uint32_to_ip(values):
+    """Format unsigned 32-bit integers as IP addresses."""
+    values = np.asarray(values, dtype=np.uint32)
+    return np.array(list(map('.'.join, zip(
+        OCTETS[values >> 24], OCTETS[(values >> 16) & 255], OCTETS[(values >> 8) & 255], OCTETS[values & 255]
+    ))), dtype=object)
+
+def format_datetimes(values):
+    """Format datetimes like `DataFrame.to_csv()` does for datetimes with microseconds."""
+    formatted = np.datetime_as_string(np.asarray(values, dtype='datetime64[us]'), unit='us').astype('U26')
+    formatted.view('U1').reshape(formatted.size, -1)[:, 10] = ' '
+    return formatted
+
+def is_binary_user_ips(user_ip_mapping_file):
+    """Check whether the path is a binary user-IP address map (see `save_user_ips()`)."""
+    return all(
+        os.path.isfile(os.path.join(user_ip_mapping_file, file)) for file in BINARY_USER_IP_FILES.values()
+    )
+
+def make_usernames(users=None):
+    """
+    Make the usernames of the user base.
+
+    Parameters:
+        - users: The number of users. By default, this is the user base of `login_attempt_simulator`
+                 (a first initial and a last name, plus the admin accounts); more users get
+                 numbered versions of those usernames (like 'asmith2').
+
+    Returns:
+        A `numpy.ndarray` of usernames.
+    """
+    names = [initial + last_name for initial in FIRST_INITIALS for last_name in LAST_NAMES]
+    if users is None:
+        users = len(names) + len(ADMIN_USERNAMES)
+    base = np.array(names + ADMIN_USERNAMES, dtype=object)
+    repeats = np.arange(users) // base.size
+    usernames = base[np.arange(users) % base.size]
+    numbered = repeats > 0
+    usernames[numbered] = usernames[numbered] + (repeats[numbered] + 1).astype(str).astype(object)
+    return usernames
+
+def assign_ip_addresses(users, seed=None):
+    """
+    Assign between one and `MAX_IPS_PER_USER` random IP addresses to each user, all at once.
+
+    Parameters:
+        - users: The number of users.
+        - seed: The seed for the random number generator.
+
+    Returns:
+        A tuple of the offsets and IP addresses like `read_user_ips()`.
+    """
+    rng = np.random.default_rng(seed)
+    counts = rng.integers(1, MAX_IPS_PER_USER + 1, size=users)
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+    return offsets, random_ips(rng, offsets[-1])
+
+def save_user_base(usernames, user_base_file):
+    """Write the usernames to a text file (one per line) like `login_attempt_simulator.utils.make_user_base()`."""
+    with open(user_base_file, 'w') as file:
+        file.writelines(f'{username}\n' for username in usernames)
+
+def save_user_ips(usernames, offsets, ips, user_ip_mapping_file):
+    """
+    Save the user-IP address map, either as JSON (if the file name ends in .json) like
+    `login_attempt_simulator.utils.save_user_ips()`, or as a directory of NumPy arrays
+    (the usernames, offsets, and `uint32` IP addresses) that can be memory-mapped.
+
+    Parameters:
+        - usernames: The usernames.
+        - offsets: The position of each user's first IP address (plus the total at the end).
+        - ips: The IP addresses as `uint32`.
+        - user_ip_mapping_file: The JSON file or directory to write to.
+
+    Returns:
+        None
+    """
+    if user_ip_mapping_file.endswith('.json'):
+        ip_strings = uint32_to_ip(ips)
+        with open(user_ip_mapping_file, 'w') as file:
+            json.dump({
+                username: ip_strings[start:end].tolist()
+                for username, start, end in zip(usernames, offsets[:-1], offsets[1:])
+            }, file)
+        return
+
+    os.makedirs(user_ip_mapping_file, exist_ok=True)
+    arrays = {
+        'usernames': np.char.encode(np.asarray(usernames, dtype=str), 'utf-8'),
+        'offsets': np.asarray(offsets, dtype=np.int64),
+        'ips': np.asarray(ips, dtype=np.uint32)
+    }
+    for name, file in BINARY_USER_IP_FILES.items():
+        np.save(os.path.join(user_ip_mapping_file, file), arrays[name])
+
+def read_user_ips(user_ip_mapping_file):
+    """
+    Read the user-IP address map into arrays.
+
+    Parameters:
+        - user_ip_mapping_file: The JSON file mapping usernames to lists of IP addresses
+                                or the directory of a binary map (see `save_user_ips()`).
+
+    Returns:
+        A tuple of the usernames, the position of each user's first IP address,
+        and all the IP addresses (as `uint32`); the IP addresses of user `i`
+        are `ips[offsets[i]:offsets[i + 1]]`.
+    """
+    if is_binary_user_ips(user_ip_mapping_file):
+        usernames, offsets, ips = (
+            np.load(os.path.join(user_ip_mapping_file, BINARY_USER_IP_FILES[name]), mmap_mode='r')
+            for name in ['usernames', 'offsets', 'ips']
+        )
+        return np.char.decode(usernames, 'utf-8').astype(object), offsets, ips
+
+    with open(user_ip_mapping_file, 'r') as file:
+        user_ips = json.load(file)
+    offsets = np.cumsum([0] + [len(ips) for ips in user_ips.values()]).astype(np.int64)
+    ips = ip_to_uint32([ip for ips in user_ips.values() for ip in ips])
+    return np.array(list(user_ips.keys()), dtype=object), offsets, ips
+
+def get_username_variations(usernames, rng):
+    """Make a username that doesn't exist from each one by dropping or replacing a character."""
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    positions = (rng.random(usernames.size) * np.array([len(username) for username in usernames])).astype(int)
+    replacements = rng.integers(0, len(letters) + 1, size=usernames.size)
+    variations = np.array([
+        username[:position] + letters[replacement:replacement + 1] + username[position + 1:]
+        for username, position, replacement in zip(usernames, positions, replacements)
+    ], dtype=object)
+    # make sure the variations don't exist (like replacing a character with itself)
+    exists = pd.Series(variations).isin(usernames).to_numpy()
+    while exists.any():
+        variations[exists] = variations[exists] + letters[0]
+        exists = pd.Series(variations).isin(usernames).to_numpy()
+    return variations
+
+def random_ips(rng, size):
+    """Generate random IP addresses (as `uint32`)."""
+    octets = rng.integers(1, 255, size=(4, size), dtype=np.uint32)
+    return (octets[0] << 24) | (octets[1] << 16) | (octets[2] << 8) | octets[3]
+
+def repeat_ranges(counts):
+    """Number the items of each group from 0 (for consecutive groups of the sizes provided)."""
+    return np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+
+class VectorizedLoginAttemptSimulator:
+    """
+    Simulate login attempts of valid users and attackers, like `login_attempt_simulator.LoginAttemptSimulator`,
+    drawing the random numbers for all hours at once instead of one event at a time.
+
+    Valid users arrive as a Poisson process and retry a wrong password until they succeed or
+    get locked out. A locked out user's later arrivals fail right away, until one of them gets
+    the account unlocked (with probability `UNLOCK_PROB` each time). Every hour, there is an
+    `attack_prob` chance of an attack starting, in which the attacker tries all the usernames
+    (with probability `try_all_users_prob`) or some of them, sometimes starting with a variation
+    that doesn't exist, using one IP address or a different one per username (`vary_ips`).
+
+    The likelihoods of each attempt are fit to the logs of `login_attempt_simulator`, so the yearly
+    success, error, and lockout rates match them. Known differences: the number of valid users
+    arriving varies a little less from hour to hour, and attackers never find a locked account.
+
+    The log is kept as arrays (IP addresses as `uint32`, usernames as codes) and is only
+    turned into strings when saving.
+
+    Parameters:
+        - user_ip_mapping_file: The JSON file mapping usernames to lists of IP addresses
+                                or the directory of a binary map (see `save_user_ips()`).
+        - start: The datetime to start the simulation at.
+        - end: The datetime to end the simulation at.
+        - seed: The seed for the random number generator.
+    """
+    def __init__(self, user_ip_mapping_file, start, end, seed=None):
+        usernames, self.ip_offsets, self.ips = read_user_ips(user_ip_mapping_file)
+        self.users = usernames.size
+        self.start = pd.Timestamp(start)
+        self.end = pd.Timestamp(end)
+        self.rng = np.random.default_rng(seed)
+
+        # codes 0 to users - 1 are the usernames and the rest are the variations that don't exist
+        variation_codes, variations = pd.factorize(get_username_variations(usernames, self.rng))
+        self.vocabulary = np.concatenate([usernames, np.asarray(variations, dtype=object)])
+        self.variation_codes = self.users + variation_codes
+        self.log = self.hack_log = None
+
+    def _get_hour_starts(self):
+        """Get the start of each hour in the simulation (in microseconds since the epoch)."""
+        start = self.start.value // 1000
+        hours = int(np.ceil((self.end.value // 1000 - start) / HOUR))
+        return start + HOUR * np.arange(hours, dtype=np.int64)
+
+    def _simulate_valid_users(self, hour_starts):
+        """Simulate the attempts of the valid users."""
+        rng = self.rng
+        arrivals = rng.poisson(VALID_USER_ARRIVALS, size=hour_starts.size)
+        count = arrivals.sum()
+        arrival_times = np.repeat(hour_starts, arrivals) + (rng.random(count) * HOUR).astype(np.int64)
+        users = rng.integers(0, self.users, size=count)
+        ip_counts = self.ip_offsets[users + 1] - self.ip_offsets[users]
+        ips = self.ips[self.ip_offsets[users] + (rng.random(count) * ip_counts).astype(np.int64)]
+
+        # the first attempt typing the password right (a mistyped username uses up the first attempt)
+        typo = rng.random(count) < USERNAME_TYPO_PROB
+        right = rng.random((count, ATTEMPTS_BEFORE_LOCKOUT)) < VALID_USER_SUCCESS
+        right[:, 0] &= ~typo
+        lockouts = ~right.any(axis=1)
+        attempts = np.where(lockouts, ATTEMPTS_BEFORE_LOCKOUT, right.argmax(axis=1) + 1)
+
+        # while locked out, an arrival is a single failed attempt that may get the account unlocked;
+        # lockouts are rare, so only the arrivals of the users who get locked out are gone through in order
+        locked = np.zeros(count, dtype=bool)
+        candidates = np.flatnonzero(np.isin(users, users[lockouts]))
+        candidates = candidates[np.lexsort((arrival_times[candidates], users[candidates]))]
+        user, is_locked, locked_at = -1, False, 0
+        for arrival in candidates:
+            if users[arrival] != user:
+                user, is_locked = users[arrival], False
+            if is_locked and arrival_times[arrival] > locked_at:
+                locked[arrival] = True
+                is_locked = rng.random() >= UNLOCK_PROB
+            elif lockouts[arrival]:
+                is_locked, locked_at = True, arrival_times[arrival] + (attempts[arrival] - 1) * VALID_USER_PAUSE
+        attempts[locked] = 1
+
+        rows = np.repeat(np.arange(count), attempts)
+        attempt = repeat_ranges(attempts)
+        mistyped = typo[rows] & ~locked[rows] & (attempt == 0)
+        success = right[rows, attempt] & ~locked[rows]
+        failure_reason = np.where(
+            locked[rows], ACCOUNT_LOCKED, np.where(mistyped, WRONG_USERNAME, WRONG_PASSWORD)
+        ).astype(np.int8)
+        failure_reason[success] = -1
+
+        return {
+            'datetime': arrival_times[rows] + attempt * VALID_USER_PAUSE,
+            'source_ip': ips[rows],
+            'username': np.where(mistyped, self.variation_codes[users[rows]], users[rows]),
+            'success': success,
+            'failure_reason': failure_reason
+        }
+
+    def _simulate_attacks(self, hour_starts, attack_prob, try_all_users_prob, vary_ips):
+        """Simulate the attacks, returning the attempts and the hack log."""
+        rng = self.rng
+        attack_hours = hour_starts[rng.random(hour_starts.size) < attack_prob]
+        attacks = attack_hours.size
+        attack_starts = attack_hours + (rng.random(attacks) * HOUR).astype(np.int64)
+        try_all = rng.random(attacks) < try_all_users_prob
+        targets = np.where(try_all, self.users, np.maximum(rng.binomial(self.users, rng.random(attacks)), 1))
+
+        # the usernames each attacker goes through (in a random order)
+        target_users = np.concatenate(
+            [rng.permutation(self.users)[:count] for count in targets] + [np.array([], dtype=np.int64)]
+        )
+        target_attack = np.repeat(np.arange(attacks), targets)
+
+        # the attempts with a username that doesn't exist (until the attacker switches to the real one)
+        tries = len(HACKER_SUCCESS)
+        guessed = np.empty((target_users.size, tries), dtype=bool)
+        guessed[:, 0] = rng.random(target_users.size) < HACKER_GUESS_USERNAME_PROB
+        for attempt in range(1, tries):
+            guessed[:, attempt] = guessed[:, attempt - 1] & (rng.random(target_users.size) >= HACKER_FIX_USERNAME_PROB)
+
+        # the attacker moves on to the next username after breaking in or running out of tries
+        right = ~guessed & (rng.random((target_users.size, tries)) < HACKER_SUCCESS)
+        attempts = np.where(right.any(axis=1), right.argmax(axis=1) + 1, tries)
+        rows = np.repeat(np.arange(target_users.size), attempts)
+        attempt = repeat_ranges(attempts)
+        attack_rows = target_attack[rows]
+        success = right[rows, attempt]
+        wrong_username = guessed[rows, attempt]
+        usernames = np.where(wrong_username, self.variation_codes[target_users[rows]], target_users[rows])
+        failure_reason = np.where(wrong_username, WRONG_USERNAME, WRONG_PASSWORD).astype(np.int8)
+        failure_reason[success] = -1
+
+        # one attempt per second from the start of the attack
+        times = attack_starts[attack_rows] \
+            + (repeat_ranges(np.bincount(attack_rows, minlength=attacks)) + 1) * HACKER_PAUSE
+        attack_ends = attack_starts.copy()
+        np.maximum.at(attack_ends, attack_rows, times)
+
+        attack_ips = random_ips(rng, attacks)
+        if vary_ips:
+            source_ips = random_ips(rng, target_users.size)
+            source_ips[np.cumsum(targets) - targets] = attack_ips
+        else:
+            source_ips = attack_ips[target_attack]
+
+        attempts_log = {
+            'datetime': times, 'source_ip': source_ips[rows], 'username': usernames,
+            'success': success, 'failure_reason': failure_reason
+        }
+        hack_log = pd.DataFrame({
+            'start': pd.to_datetime(attack_starts, unit='us'),
+            'end': pd.to_datetime(attack_ends, unit='us'),
+            'source_ip': uint32_to_ip(attack_ips)
+        })
+        return attempts_log, hack_log
+
+    def simulate(self, *, attack_prob, try_all_users_prob, vary_ips):
+        """
+        Simulate login attempts.
+
+        Parameters:
+            - attack_prob: The probability of an attack starting in a given hour.
+            - try_all_users_prob: The probability the attacker tries all the usernames.
+            - vary_ips: Whether the attacker uses a different IP address for each username.
+
+        Returns:
+            None
+        """
+        hour_starts = self._get_hour_starts()
+        valid_users = self._simulate_valid_users(hour_starts)
+        attacks, self.hack_log = self._simulate_attacks(hour_starts, attack_prob, try_all_users_prob, vary_ips)
+
+        columns = {column: np.concatenate([valid_users[column], attacks[column]]) for column in valid_users}
+        order = np.argsort(columns['datetime'], kind='mergesort')
+        self.log = pd.DataFrame({
+            'datetime': pd.to_datetime(columns['datetime'][order], unit='us'),
+            'source_ip': columns['source_ip'][order],
+            'username': pd.Categorical.from_codes(columns['username'][order], self.vocabulary),
+            'success': columns['success'][order],
+            'failure_reason': pd.Categorical.from_codes(columns['failure_reason'][order], FAILURE_REASONS)
+        })
+
+    def save_log(self, filename, chunksize=1000000):
+        """Save the login attempts to a CSV file, turning them into strings one chunk at a time."""
+        if any(set(username) & set(',"\n') for username in self.vocabulary):
+            # usernames that need quoting
+            self.log.assign(source_ip=lambda x: uint32_to_ip(x.source_ip)).to_csv(filename, index=False)
+            return
+
+        # strings for each of the codes
+        success = np.array(['False', 'True'], dtype=object)
+        failure_reasons = np.array([''] + FAILURE_REASONS, dtype=object)
+        with open(filename, 'w') as file:
+            file.write(','.join(self.log.columns) + '\n')
+            for start in range(0, len(self.log), chunksize):
+                chunk = self.log.iloc[start:start + chunksize]
+                file.writelines(f'{row}\n' for row in map(','.join, zip(
+                    format_datetimes(chunk.datetime).tolist(),
+                    uint32_to_ip(chunk.source_ip),
+                    self.vocabulary[chunk.username.cat.codes.to_numpy()],
+                    success[chunk.success.to_numpy().astype(int)],
+                    failure_reasons[chunk.failure_reason.cat.codes.to_numpy() + 1]
+                )))
+
+    def save_hack_log(self, filename):
+        """Save the attacks to a CSV file."""
+        self.hack_log.to_csv(filename, index=False)
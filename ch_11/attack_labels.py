@@ -0,0 +1,87 @@
+"""Utility functions for labeling datetimes with the attacks happening at the time."""
+
+import numpy as np
+import pandas as pd
+
+class AttackIntervals:
+    """
+    Attack intervals sorted once so that any number of datetimes can be
+    labeled with binary search instead of materializing every attack minute.
+
+    Parameters:
+        - hackers: The dataframe indicating when the attacks started and stopped
+                   (`start` and `end` columns); its index is used as the attack id.
+        - resolution: The granularity of the datetimes that will be labeled. Attacks are
+                      widened to the buckets of this size that they touch. Default is 1 minute.
+    """
+    def __init__(self, hackers, resolution='1min'):
+        starts = pd.to_datetime(hackers.start).dt.floor(resolution).to_numpy(dtype='datetime64[ns]')
+        ends = pd.to_datetime(hackers.end).dt.ceil(resolution).to_numpy(dtype='datetime64[ns]')
+
+        order = np.argsort(starts, kind='mergesort')
+        self.starts = starts[order]
+        self.ids = hackers.index.to_numpy()[order]
+
+        # attacks can overlap, so track the attack reaching the furthest out of those started so far
+        ends = ends[order]
+        self.furthest_end = np.maximum.accumulate(ends) if ends.size else ends
+        self.furthest_attack = np.maximum.accumulate(
+            np.where(ends == self.furthest_end, np.arange(ends.size), 0)
+        ) if ends.size else np.arange(0)
+
+    def label(self, datetimes):
+        """
+        Find which datetimes fall within an attack.
+
+        Parameters:
+            - datetimes: Array-like of datetimes to check.
+
+        Returns:
+            A tuple of a boolean `numpy.ndarray` indicating whether each datetime falls within an
+            attack and an array with the id of an attack it falls in (`None` when it doesn't).
+        """
+        datetimes = pd.to_datetime(np.asarray(datetimes)).to_numpy(dtype='datetime64[ns]')
+        ids = np.full(datetimes.size, None, dtype=object)
+        if not self.starts.size:
+            return np.zeros(datetimes.size, dtype=bool), ids
+
+        # the last attack to start at or before each datetime
+        position = np.searchsorted(self.starts, datetimes, side='right') - 1
+        started = position >= 0
+        attack = self.furthest_attack[np.where(started, position, 0)]
+        is_attack = started & (self.furthest_end[attack] >= datetimes)
+
+        ids[is_attack] = self.ids[attack[is_attack]]
+        return is_attack, ids
+
+def label_attacks(datetimes, hackers, resolution='1min'):
+    """
+    Label datetimes with whether a hacker attempted a log in during that time and which attack it was.
+
+    Parameters:
+        - datetimes: The datetimes to check for hackers
+        - hackers: The dataframe indicating when the attacks started and stopped
+        - resolution: The granularity of the datetime. Default is 1 minute.
+
+    Returns:
+        `pandas.DataFrame` with `is_hacker` and `attack_id` columns, indexed like `datetimes`.
+    """
+    is_hacker, attack_id = AttackIntervals(hackers, resolution).label(datetimes)
+    return pd.DataFrame(
+        {'is_hacker': is_hacker, 'attack_id': attack_id},
+        index=getattr(datetimes, 'index', None)
+    )
+
+def get_y(datetimes, hackers, resolution='1min'):
+    """
+    Get data we can use for the y (whether or not a hacker attempted a log in during that time).
+
+    Parameters:
+        - datetimes: The datetimes to check for hackers
+        - hackers: The dataframe indicating when the attacks started and stopped
+        - resolution: The granularity of the datetime. Default is 1 minute.
+
+    Returns:
+        `pandas.Series` of Booleans.
+    """
+    return label_attacks(datetimes, hackers, resolution).is_hacker.rename(getattr(datetimes, 'name', None))
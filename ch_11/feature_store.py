@@ -0,0 +1,158 @@
+"""Utility functions for caching the per-minute failure features used to build the X for the models."""
+
+import hashlib
+import os
+
+import pandas as pd
+
+# the feature stores used by `get_X()`, by cache file
+_stores = {}
+
+def hash_rows(log):
+    """Hash each row of the parts of the log the features depend on (the datetimes, usernames, and successes)."""
+    return pd.util.hash_pandas_object(log[['username', 'success']], index=True).to_numpy()
+
+def fingerprint(log, row_hashes=None):
+    """
+    Hash the parts of the log the features depend on (the datetimes, usernames, and successes).
+
+    Parameters:
+        - log: The logs dataframe
+        - row_hashes: The result of `hash_rows()` on the log, if we already have it.
+
+    Returns:
+        A string with the SHA-256 hash.
+    """
+    if row_hashes is None:
+        row_hashes = hash_rows(log)
+    return hashlib.sha256(row_hashes.tobytes()).hexdigest()
+
+def get_minute_features(log):
+    """
+    Calculate the number of usernames with failures and the number of failures per minute,
+    only for the minutes that had failures.
+
+    Parameters:
+        - log: The logs dataframe
+
+    Returns:
+        A `pandas.DataFrame` object indexed by minute.
+    """
+    failures = log[~log.success.astype(bool)]
+    return failures.groupby(failures.index.floor('min').rename('datetime')).agg(
+        usernames_with_failures=('username', 'nunique'),
+        failures=('username', 'size')
+    )
+
+class FeatureStore:
+    """
+    Per-minute failure features for the whole log, computed once and saved to disk
+    along with a fingerprint of the log they came from. When the log grows, only the
+    features for the new minutes are calculated.
+
+    Parameters:
+        - cache_file: The file to save the features to.
+    """
+    def __init__(self, cache_file=os.path.join('logs', 'feature_cache.pkl')):
+        self.cache_file = cache_file
+        self.features = None
+        # the log the features are for and how many rows it had
+        self._log, self._rows = None, None
+
+    def _load(self):
+        """Read the cached features (and what they cover) from disk, if we have them."""
+        try:
+            return pd.read_pickle(self.cache_file)
+        except FileNotFoundError:
+            return None
+
+    def update(self, log):
+        """
+        Make sure the features cover the log, reusing what is cached. The cache is used
+        when the log starts with the exact rows it was built from, in which case only
+        the rows from the last (possibly incomplete) minute onward are processed. Calling
+        it again with the same log object (without rows added to it) does nothing.
+
+        Parameters:
+            - log: The logs dataframe
+
+        Returns:
+            The `FeatureStore` object (to allow chaining).
+        """
+        if log is self._log and len(log) == self._rows:
+            return self
+        log_seen, rows_seen = log, len(log)
+
+        if not log.index.is_monotonic_increasing:
+            log = log.sort_index(kind='mergesort')
+
+        # hashed once, since the fingerprints are of the rows before a given minute
+        row_hashes = hash_rows(log)
+        def fingerprint_until(when):
+            return fingerprint(log, row_hashes[:log.index.searchsorted(when)])
+
+        cache = self._load()
+        matches = cache is not None and cache['fingerprint'] == fingerprint_until(cache['covered_until'])
+        if matches:
+            features = pd.concat([
+                cache['features'], get_minute_features(log[log.index >= cache['covered_until']])
+            ])
+        else:
+            features = get_minute_features(log)
+
+        # the last minute may not be complete, so it isn't saved; a cache for other rows is replaced
+        covered_until = log.index.max().floor('min') if not log.empty else pd.Timestamp.min
+        if not matches or covered_until != cache['covered_until']:
+            os.makedirs(os.path.dirname(self.cache_file) or '.', exist_ok=True)
+            pd.to_pickle({
+                'fingerprint': fingerprint_until(covered_until),
+                'covered_until': covered_until,
+                'features': features[features.index < covered_until]
+            }, self.cache_file)
+
+        self.features = features
+        self._log, self._rows = log_seen, rows_seen
+        return self
+
+    def get_X(self, day):
+        """
+        Get data we can use for the X (the same as the `get_X()` function in the notebooks).
+
+        Parameters:
+            - day: A day or single value we can use as a datetime index slice
+
+        Returns:
+            A `pandas.DataFrame` object
+        """
+        if self.features is None:
+            raise ValueError('Call `update()` with the log first.')
+
+        features = self.features.loc[day]
+        # resampling fills in the minutes without failures between the first and last failure
+        if not features.empty:
+            features = features.reindex(
+                pd.date_range(features.index.min(), features.index.max(), freq='1min', name='datetime'),
+                fill_value=0
+            )
+        return pd.get_dummies(features.assign(
+            day_of_week=lambda x: x.index.dayofweek,
+            hour=lambda x: x.index.hour
+        ).drop(columns=['failures']), columns=['day_of_week', 'hour'])
+
+def get_X(log, day, cache_file=os.path.join('logs', 'feature_cache.pkl')):
+    """
+    Get data we can use for the X, using (and updating) the feature cache. The features
+    are kept in memory between calls, so calling this for each month of the same log only
+    calculates (or reads) them once.
+
+    Parameters:
+        - log: The logs dataframe
+        - day: A day or single value we can use as a datetime index slice
+        - cache_file: The file the features are cached in.
+
+    Returns:
+        A `pandas.DataFrame` object
+    """
+    if cache_file not in _stores:
+        _stores[cache_file] = FeatureStore(cache_file)
+    return _stores[cache_file].update(log).get_X(day)
@@ -0,0 +1,199 @@
+"""Month-partitioned columnar storage for the merged login attempt logs."""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow.feather as feather
+except ImportError:
+    feather = None
+
+INDEX_FILE = 'index.json'
+
+def get_period_bounds(when=None, start=None, end=None):
+    """Turn a datetime index slice (like '2018-01' or '2019-Q1') and/or start and end into timestamps."""
+    if when is not None:
+        period = pd.Period(when)
+        start, end = period.start_time, period.end_time
+    return (
+        pd.Timestamp(start) if start is not None else None,
+        pd.Timestamp(end) if end is not None else None
+    )
+
+def read_index(table_directory):
+    """Read the metadata index of a table in the store (empty if the table doesn't exist yet)."""
+    try:
+        with open(os.path.join(table_directory, INDEX_FILE), 'r') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {'index_col': None, 'partitions': {}}
+
+def _write_columns(data, partition_directory):
+    """Save each column of a partition as a NumPy file, storing strings as codes into their unique values."""
+    os.makedirs(partition_directory, exist_ok=True)
+    columns = {}
+    for column, values in data.reset_index().items():
+        if pd.api.types.is_string_dtype(values):
+            codes, uniques = pd.factorize(values)
+            np.save(os.path.join(partition_directory, f'{column}.npy'), codes.astype(np.int32))
+            np.save(
+                os.path.join(partition_directory, f'{column}.uniques.npy'),
+                np.asarray(uniques, dtype=str)
+            )
+            columns[column] = 'codes'
+        else:
+            np.save(os.path.join(partition_directory, f'{column}.npy'), values.to_numpy())
+            columns[column] = 'values'
+    return columns
+
+def _read_columns(partition_directory, columns):
+    """Read the NumPy files of a partition back into a `pandas.DataFrame`."""
+    data = {}
+    for column, kind in columns.items():
+        values = np.load(os.path.join(partition_directory, f'{column}.npy'), mmap_mode='r')
+        if kind == 'codes':
+            uniques = np.load(os.path.join(partition_directory, f'{column}.uniques.npy'))
+            values = pd.Categorical.from_codes(values, uniques.astype(object)).astype(object)
+        data[column] = values
+    return pd.DataFrame(data)
+
+class PartitionWriter:
+    """
+    Write time-sorted data to a table in the store, one partition per month.
+    Data can be passed in pieces (as long as they come in time order), so
+    only one month is held in memory at a time.
+
+    Parameters:
+        - directory: The directory of the store.
+        - table: The name of the table (a subdirectory of the store).
+        - parse_dates: Additional (non-index) columns to store as datetimes.
+        - use_feather: Whether to write Feather files instead of NumPy files.
+                       Defaults to using Feather when `pyarrow` is installed.
+    """
+    def __init__(self, directory, table, parse_dates=None, use_feather=None):
+        self.table_directory = os.path.join(directory, table)
+        self.parse_dates = parse_dates or []
+        self.use_feather = feather is not None if use_feather is None else use_feather
+        if self.use_feather and feather is None:
+            raise ImportError('Writing Feather files requires `pyarrow`.')
+        self.index = read_index(self.table_directory)
+        self._pieces = []
+        self._month = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def append(self, data):
+        """
+        Add data to the table.
+
+        Parameters:
+            - data: A `pandas.DataFrame` with a sorted `DatetimeIndex`, which
+                    starts no earlier than the data previously appended.
+
+        Returns:
+            None
+        """
+        if data.empty:
+            return
+        months = data.index.to_period('M')
+        for month in months.unique():
+            piece = data[months == month]
+            if month != self._month:
+                self.flush()
+                self._month = month
+            self._pieces.append(piece)
+
+    def flush(self):
+        """Write the month currently being collected to its partition."""
+        if not self._pieces:
+            return
+        data = pd.concat(self._pieces)
+        for column in self.parse_dates:
+            data[column] = pd.to_datetime(data[column])
+
+        name = str(self._month)
+        path = os.path.join(self.table_directory, name)
+        partition = {
+            'min': str(data.index.min()), 'max': str(data.index.max()), 'rows': len(data)
+        }
+        if self.use_feather:
+            os.makedirs(self.table_directory, exist_ok=True)
+            feather.write_feather(data.reset_index(), f'{path}.feather')
+            partition['format'] = 'feather'
+        else:
+            partition['format'] = 'numpy'
+            partition['columns'] = _write_columns(data, path)
+
+        self.index['index_col'] = data.index.name
+        self.index['partitions'][name] = partition
+        self._pieces = []
+
+    def close(self):
+        """Write anything left to its partition and save the metadata index."""
+        self.flush()
+        os.makedirs(self.table_directory, exist_ok=True)
+        self.index['partitions'] = dict(sorted(self.index['partitions'].items()))
+        with open(os.path.join(self.table_directory, INDEX_FILE), 'w') as file:
+            json.dump(self.index, file, indent=2)
+
+def write_partitions(data, directory, table, parse_dates=None, use_feather=None):
+    """
+    Write a `pandas.DataFrame` with a `DatetimeIndex` to a table in the store,
+    one partition per month (see `PartitionWriter`).
+
+    Parameters:
+        - data: The `pandas.DataFrame` to write.
+        - directory: The directory of the store.
+        - table: The name of the table (a subdirectory of the store).
+        - parse_dates: Additional (non-index) columns to store as datetimes.
+        - use_feather: Whether to write Feather files instead of NumPy files.
+
+    Returns:
+        None
+    """
+    with PartitionWriter(directory, table, parse_dates, use_feather) as writer:
+        writer.append(data.sort_index())
+
+def read_partitions(directory, table, when=None, *, start=None, end=None):
+    """
+    Read the rows of a table in the store that fall in a time range,
+    only touching the partitions that overlap with it.
+
+    Parameters:
+        - directory: The directory of the store.
+        - table: The name of the table (a subdirectory of the store).
+        - when: A datetime index slice, like '2018-01' or '2019-Q1'.
+        - start: The datetime to start at, if `when` isn't provided.
+        - end: The datetime to end at (inclusive), if `when` isn't provided.
+
+    Returns:
+        A `pandas.DataFrame` with a `DatetimeIndex`.
+    """
+    table_directory = os.path.join(directory, table)
+    index = read_index(table_directory)
+    start, end = get_period_bounds(when, start, end)
+
+    pieces = []
+    for name, partition in index['partitions'].items():
+        if (start is not None and pd.Timestamp(partition['max']) < start) \
+                or (end is not None and pd.Timestamp(partition['min']) > end):
+            continue
+        path = os.path.join(table_directory, name)
+        if partition['format'] == 'feather':
+            if feather is None:
+                raise ImportError('Reading Feather files requires `pyarrow`.')
+            pieces.append(feather.read_feather(f'{path}.feather'))
+        else:
+            pieces.append(_read_columns(path, partition['columns']))
+
+    if not pieces:
+        return pd.DataFrame()
+    data = pd.concat(pieces, ignore_index=True).set_index(index['index_col'])
+    return data.loc[start:end]
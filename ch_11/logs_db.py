@@ -0,0 +1,330 @@
+"""Script for bulk loading the merged logs into the logs.db SQLite database."""
+
+import argparse
+import csv
+import datetime as dt
+import itertools
+import logging
+import os
+import sqlite3
+import sys
+import time
+
+import pandas as pd
+
+import log_store
+
+# Logging configuration
+FORMAT = '[%(levelname)s] [ %(name)s ] %(message)s'
+logging.basicConfig(level=logging.INFO, format=FORMAT)
+logger = logging.getLogger(os.path.basename(__file__))
+
+EPOCH = dt.datetime(1970, 1, 1)
+
+# the merged files for each table along with the kind of data in each column
+TABLES = {
+    'logs': {
+        'files': ['logs_2018.csv', 'logs_2019.csv'],
+        'columns': {
+            'datetime': 'datetime', 'source_ip': 'text', 'username': 'text',
+            'success': 'bool', 'failure_reason': 'text'
+        },
+        'index': 'datetime'
+    },
+    'attacks': {
+        'files': ['hackers_2018.csv', 'hackers_2019.csv'],
+        'columns': {'start': 'datetime', 'end': 'datetime', 'source_ip': 'text'},
+        'index': 'start'
+    }
+}
+
+# SQLite types per schema: `text` is what `DataFrame.to_sql()` creates and the notebooks query,
+# while `integer` stores datetimes as nanoseconds since the epoch so range queries compare integers
+SCHEMAS = {
+    'text': {'datetime': 'TEXT', 'text': 'TEXT', 'bool': 'INTEGER'},
+    'integer': {'datetime': 'INTEGER', 'text': 'TEXT', 'bool': 'INTEGER'}
+}
+
+def get_indexes(table, schema):
+    """
+    Get the indexes to create on a table.
+
+    Parameters:
+        - table: The name of the table.
+        - schema: Either 'text' (the index `DataFrame.to_sql()` creates) or 'integer'
+                  (an index on the datetimes covering every column, so time range queries
+                  never touch the table, plus one on the source IP address and datetime).
+
+    Returns:
+        Dictionary mapping the index names to the columns they index.
+    """
+    index_col = TABLES[table]['index']
+    if schema == 'text':
+        return {f'ix_{table}_{index_col}': [index_col]}
+    return {
+        f'ix_{table}_{index_col}': [index_col] + [
+            column for column in TABLES[table]['columns'] if column != index_col
+        ],
+        f'ix_{table}_source_ip_{index_col}': ['source_ip', index_col]
+    }
+
+def to_epoch_ns(timestamp):
+    """Convert a datetime string like '2018-01-01 00:05:32.988414' into nanoseconds since the epoch."""
+    return (dt.datetime.fromisoformat(timestamp) - EPOCH) // dt.timedelta(microseconds=1) * 1000
+
+def configure_connection(conn, cache_size=512, synchronous='OFF'):
+    """
+    Tune the SQLite connection for bulk loading.
+
+    Parameters:
+        - conn: The `sqlite3.Connection` object.
+        - cache_size: Size of the page cache in MB.
+        - synchronous: The synchronous level to use while loading ('OFF', 'NORMAL', or 'FULL').
+
+    Returns:
+        None
+    """
+    conn.execute('PRAGMA journal_mode = WAL;')
+    conn.execute(f'PRAGMA synchronous = {synchronous};')
+    conn.execute(f'PRAGMA cache_size = -{cache_size * 1024};') # negative values are in KiB
+    conn.execute('PRAGMA temp_store = MEMORY;')
+
+def read_rows(file, columns, schema='text'):
+    """
+    Lazily read the rows of a merged log file, converting them to what SQLite should store.
+
+    Parameters:
+        - file: The CSV file to read.
+        - columns: Dictionary mapping the columns (in order) to the kind of data they hold.
+        - schema: Either 'text' or 'integer' (see `SCHEMAS`).
+
+    Returns:
+        A generator of tuples.
+    """
+    converters = {
+        'text': lambda x: x or None,
+        'bool': lambda x: None if x == '' else int(x == 'True'),
+        'datetime': (lambda x: to_epoch_ns(x) if x else None) if schema == 'integer' else (lambda x: x or None)
+    }
+    converters = [converters[kind] for kind in columns.values()]
+    with open(file, 'r', newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        if header != list(columns):
+            raise ValueError(f'{file} has columns {header}, but {list(columns)} were expected.')
+        for row in reader:
+            yield tuple(convert(value) for convert, value in zip(converters, row))
+
+def create_table(conn, table, schema='text', name=None):
+    """Create an empty table (named `name`, if provided) with the columns of `table` in a given schema."""
+    columns = ', '.join(
+        f'"{column}" {SCHEMAS[schema][kind]}' for column, kind in TABLES[table]['columns'].items()
+    )
+    conn.execute(f'CREATE TABLE "{name or table}" ({columns});')
+
+def create_indexes(conn, table, schema='text'):
+    """Create the indexes for a table (see `get_indexes()`)."""
+    for name, columns in get_indexes(table, schema).items():
+        columns = ', '.join(f'"{column}"' for column in columns)
+        conn.execute(f'CREATE INDEX "{name}" ON "{table}" ({columns});')
+
+def load_table(conn, table, files, batch_size=100000, schema='text'):
+    """
+    Replace a table with the rows in the given files, inserting them in large batches
+    and only creating the indexes once all the rows are in.
+
+    Parameters:
+        - conn: The `sqlite3.Connection` object (opened with `isolation_level=None`).
+        - table: The name of the table (a key of `TABLES`).
+        - files: The CSV files to load into the table.
+        - batch_size: The number of rows to insert per transaction.
+        - schema: Either 'text' or 'integer' (see `SCHEMAS`).
+
+    Returns:
+        The number of rows loaded.
+    """
+    columns = TABLES[table]['columns']
+    conn.execute(f'DROP TABLE IF EXISTS "{table}";')
+    create_table(conn, table, schema)
+    insert = f'INSERT INTO "{table}" VALUES ({", ".join("?" * len(columns))});'
+
+    rows_loaded = 0
+    for file in files:
+        rows = read_rows(file, columns, schema)
+        while True:
+            batch = list(itertools.islice(rows, batch_size))
+            if not batch:
+                break
+            conn.execute('BEGIN;')
+            conn.executemany(insert, batch)
+            conn.execute('COMMIT;')
+            rows_loaded += len(batch)
+
+    create_indexes(conn, table, schema)
+    return rows_loaded
+
+def build_database(db_file, directory='logs', batch_size=100000, cache_size=512, synchronous='OFF', schema='text'):
+    """
+    Load the merged logs into the `logs` and `attacks` tables of a SQLite database.
+
+    Parameters:
+        - db_file: The SQLite database file.
+        - directory: The directory holding the merged log files.
+        - batch_size: The number of rows to insert per transaction.
+        - cache_size: Size of the page cache in MB.
+        - synchronous: The synchronous level to use while loading ('OFF', 'NORMAL', or 'FULL').
+        - schema: Either 'text' or 'integer' (see `SCHEMAS`).
+
+    Returns:
+        Dictionary mapping each table to the number of rows loaded into it.
+    """
+    conn = sqlite3.connect(db_file, isolation_level=None)
+    try:
+        configure_connection(conn, cache_size, synchronous)
+        rows_loaded = {}
+        for table, info in TABLES.items():
+            start = time.perf_counter()
+            rows_loaded[table] = load_table(
+                conn, table, [os.path.join(directory, file) for file in info['files']], batch_size, schema
+            )
+            elapsed = time.perf_counter() - start
+            logger.info(
+                f'Loaded {rows_loaded[table]:,d} rows into {table} in {elapsed:.2f} seconds '
+                f'({rows_loaded[table] / elapsed:,.0f} rows per second)'
+            )
+        # leave the database as a single file, like `DataFrame.to_sql()` does
+        conn.execute('PRAGMA synchronous = FULL;')
+        conn.execute('PRAGMA journal_mode = DELETE;')
+    finally:
+        conn.close()
+    return rows_loaded
+
+def get_schema(conn, table):
+    """Determine whether a table stores its datetimes as 'text' or 'integer'."""
+    column_types = {row[1]: row[2] for row in conn.execute(f'PRAGMA table_info("{table}");')}
+    if not column_types:
+        raise ValueError(f'There is no {table} table in the database.')
+    return 'integer' if column_types[TABLES[table]['index']].upper() == 'INTEGER' else 'text'
+
+def migrate_database(db_file, cache_size=512):
+    """
+    Convert the `logs` and `attacks` tables of an existing database from datetime strings
+    to nanoseconds since the epoch, replacing their indexes with those of the integer schema.
+
+    Parameters:
+        - db_file: The SQLite database file.
+        - cache_size: Size of the page cache in MB.
+
+    Returns:
+        List of the tables that were migrated.
+    """
+    conn = sqlite3.connect(db_file, isolation_level=None)
+    migrated = []
+    try:
+        configure_connection(conn, cache_size, 'NORMAL')
+        for table, info in TABLES.items():
+            if get_schema(conn, table) == 'integer':
+                logger.info(f'{table} already stores integer datetimes')
+                continue
+
+            # convert 'YYYY-MM-DD HH:MM:SS' to seconds and pad the (optional) fraction out to nanoseconds
+            converted = ', '.join(
+                f"""CAST(strftime('%s', substr("{column}", 1, 19)) AS INTEGER) * 1000000000 """
+                f"""+ CAST(substr(substr("{column}", 21) || '000000000', 1, 9) AS INTEGER)"""
+                if kind == 'datetime' else f'"{column}"'
+                for column, kind in info['columns'].items()
+            )
+            conn.execute('BEGIN;')
+            create_table(conn, table, 'integer', name=f'{table}_migrated')
+            conn.execute(f'INSERT INTO "{table}_migrated" SELECT {converted} FROM "{table}";')
+            conn.execute(f'DROP TABLE "{table}";')
+            conn.execute(f'ALTER TABLE "{table}_migrated" RENAME TO "{table}";')
+            create_indexes(conn, table, 'integer')
+            conn.execute('COMMIT;')
+            migrated.append(table)
+            logger.info(f'Migrated {table} to integer datetimes')
+        conn.execute('PRAGMA journal_mode = DELETE;')
+    finally:
+        conn.close()
+    return migrated
+
+def read_table(conn, table='logs', when=None, *, start=None, end=None):
+    """
+    Read the rows of the `logs` or `attacks` table in a time range as a `pandas.DataFrame`
+    with datetime columns and the datetime/start column as the index. With the integer
+    schema, this is a range scan on the index and there are no datetime strings to parse.
+
+    Parameters:
+        - conn: The `sqlite3.Connection` object.
+        - table: Either 'logs' or 'attacks'.
+        - when: A datetime index slice, like '2018-01' or '2019-Q1'.
+        - start: The datetime to start at, if `when` isn't provided.
+        - end: The datetime to end at (inclusive), if `when` isn't provided.
+
+    Returns:
+        A `pandas.DataFrame` object.
+    """
+    info = TABLES[table]
+    index_col = info['index']
+    schema = get_schema(conn, table)
+    start, end = log_store.get_period_bounds(when, start, end)
+
+    conditions, params = [], []
+    for bound, operator in [(start, '>='), (end, '<=')]:
+        if bound is not None:
+            conditions.append(f'"{index_col}" {operator} ?')
+            params.append(bound.value if schema == 'integer' else str(bound))
+    where = f' WHERE {" AND ".join(conditions)}' if conditions else ''
+
+    data = pd.read_sql(f'SELECT * FROM "{table}"{where} ORDER BY "{index_col}";', conn, params=params)
+    for column, kind in info['columns'].items():
+        if kind == 'datetime':
+            data[column] = pd.to_datetime(data[column], unit='ns' if schema == 'integer' else None)
+        elif kind == 'bool':
+            data[column] = data[column].astype(bool)
+    return data.set_index(index_col)
+
+if __name__ == '__main__':
+    # command line argument parsing
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '-d', '--db', help='SQLite database file to write to (defaults to logs/logs.db)'
+    )
+    parser.add_argument(
+        '-b', '--batch-size', type=int, default=100000, help='number of rows to insert per transaction'
+    )
+    parser.add_argument(
+        '-c', '--cache-size', type=int, default=512, help='SQLite page cache size in MB'
+    )
+    parser.add_argument(
+        '-s', '--synchronous', choices=['OFF', 'NORMAL', 'FULL'], default='OFF',
+        help='SQLite synchronous level to use while loading'
+    )
+    parser.add_argument(
+        '-i', '--integer', action='store_true',
+        help='store datetimes as nanoseconds since the epoch with range indexes (instead of as text)'
+    )
+    parser.add_argument(
+        '-m', '--migrate', action='store_true',
+        help='convert the tables of an existing database to integer datetimes instead of loading the logs'
+    )
+    args = parser.parse_args()
+
+    # make sure we use the files in the proper directory no matter where we called the script from
+    db_file = os.path.abspath(args.db) if args.db else os.path.join('logs', 'logs.db')
+    directory = os.path.dirname(os.path.realpath(sys.argv[0]))
+    os.chdir(directory)
+
+    start = time.perf_counter()
+    if args.migrate:
+        migrate_database(db_file, args.cache_size)
+        logger.info(f'All done! Migrated in {time.perf_counter() - start:.2f} seconds')
+    else:
+        total_rows = sum(build_database(
+            db_file, 'logs', args.batch_size, args.cache_size, args.synchronous,
+            schema='integer' if args.integer else 'text'
+        ).values())
+        elapsed = time.perf_counter() - start
+        logger.info(
+            f'All done! {total_rows:,d} rows in {elapsed:.2f} seconds ({total_rows / elapsed:,.0f} rows per second)'
+        )
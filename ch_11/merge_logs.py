@@ -1,9 +1,23 @@
 """Script for merging the logs in a month-by-month simulation."""
 
+import argparse
+import calendar
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import heapq
+import json
 import os
 import sys
+import numpy as np
 import pandas as pd
 
+import log_store
+
+MONTHS = [month.lower() for month in calendar.month_abbr[1:]]
+MANIFEST_FILE = 'merge_manifest.json'
+# fixed format for writing the datetimes, since `to_csv()` drops the microseconds when a chunk has none
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
 def cat_csvs(format_string_file_pattern, index_col, month_list):
     """
     Utility function for concatentating CSV files from simulation.
@@ -22,6 +36,95 @@ def cat_csvs(format_string_file_pattern, index_col, month_list):
         ) for file in month_list
     ]).sort_index()
 
+def stream_csvs(format_string_file_pattern, index_col, month_list, out_file, *,
+                chunksize=100000, workers=4, spillover=None, start=None, end=None, partition_writer=None):
+    """
+    Streaming version of `cat_csvs()` that writes the result to a file instead of returning it.
+    Since each monthly file is already sorted by time, we do a k-way merge of the files
+    reading them in chunks (in parallel), so memory is bounded by `chunksize` times the
+    number of files, no matter how big the logs are.
+
+    Parameters:
+        - format_string_file_pattern: The pattern for the file name with `{}` in the place of the month
+        - index_col: The column with the datetimes to sort on.
+        - month_list: The list of the months as formatted in the file names.
+        - out_file: The file to write the merged CSV to.
+        - chunksize: The number of rows to read from a file at a time.
+        - workers: The number of threads to use for parsing the files.
+        - spillover: Optional (small) `pandas.DataFrame`, sorted by its index, to merge in as well.
+        - start: Drop rows before this datetime.
+        - end: Don't write rows after this datetime; instead, return them.
+        - partition_writer: Optional `log_store.PartitionWriter` to also write the rows to.
+
+    Returns:
+        A `pandas.DataFrame` of the rows after `end`, sorted by time.
+    """
+    start = pd.Timestamp(start) if start is not None else None
+    end = pd.Timestamp(end) if end is not None else None
+    overflow = []
+
+    def write(data):
+        """Write the rows in the period to the file, holding onto the ones after it."""
+        if start is not None:
+            data = data[data.index >= start]
+        if end is not None:
+            overflow.append(data[data.index > end])
+            data = data[data.index <= end]
+        if partition_writer is not None:
+            partition_writer.append(data)
+        header = not write.called
+        if header or not data.empty:
+            data.to_csv(out_file, mode='w' if header else 'a', header=header, date_format=DATE_FORMAT)
+            write.called = True
+    write.called = False
+
+    readers = [
+        pd.read_csv(
+            format_string_file_pattern.format(file), index_col=index_col,
+            parse_dates=True, chunksize=chunksize
+        ) for file in month_list
+    ]
+    buffers = {}
+    if spillover is not None and not spillover.empty:
+        buffers[len(readers)] = spillover
+
+    # heap of the last datetime read from each file that still has rows to read
+    heap = []
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # always have the next chunk of every file being parsed
+        pending = {source: pool.submit(next, reader, None) for source, reader in enumerate(readers)}
+
+        def refill(source):
+            """Swap in the next chunk of a file and start parsing the one after it."""
+            chunk = pending.pop(source).result()
+            if chunk is None or chunk.empty:
+                buffers.pop(source, None)
+                readers[source].close()
+            else:
+                buffers[source] = chunk
+                pending[source] = pool.submit(next, readers[source], None)
+                heapq.heappush(heap, (chunk.index[-1], source))
+
+        for source in range(len(readers)):
+            refill(source)
+
+        while heap:
+            # no row left to read can come before the smallest of the last datetimes read
+            cutoff, source = heapq.heappop(heap)
+            pieces = []
+            for key in sorted(buffers):
+                split = buffers[key].index.searchsorted(cutoff, side='right')
+                pieces.append(buffers[key].iloc[:split])
+                buffers[key] = buffers[key].iloc[split:]
+            write(pd.concat(pieces).sort_index(kind='mergesort'))
+            refill(source)
+
+    if buffers:
+        write(pd.concat([buffers[key] for key in sorted(buffers)]).sort_index(kind='mergesort'))
+
+    return pd.concat(overflow) if overflow else pd.DataFrame()
+
 def get_spillover(data, when):
     """Returns data from spillover"""
     try:
@@ -29,29 +132,306 @@ def get_spillover(data, when):
     except KeyError:
         return pd.DataFrame()
 
-if __name__ == '__main__':
-    # make sure we write the files to the proper directory no matter where we called the script from
-    directory = os.path.dirname(os.path.realpath(sys.argv[0]))
-    os.chdir(directory)
+def merge_month_files(format_string_file_pattern, index_col, month_list, previous=None, when=None):
+    """
+    Concatenate a year's monthly files, adding any rows that spilled over from the prior year.
 
-    logs_2018 = cat_csvs(
-        'logs/{}_2018.csv', 'datetime',
-        ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec']
-    )
-    logs_2018.loc['2018'].to_csv('logs/logs_2018.csv') # sometimes the simulation overshoots the end date
+    Parameters:
+        - format_string_file_pattern: The pattern for the file name with `{}` in the place of the month
+        - index_col: The column with the datetimes to sort on.
+        - month_list: The list of the months as formatted in the file names.
+        - previous: The merged `pandas.DataFrame` of the prior year, if it was simulated.
+        - when: The datetime index slice of `previous` that belongs to this year.
+
+    Returns:
+        A sorted `pandas.DataFrame` including any overshoot past the last month.
+    """
+    data = cat_csvs(format_string_file_pattern, index_col, month_list)
+    if previous is not None:
+        data = pd.concat([data, get_spillover(previous, when)]).sort_index()
+    return data
+
+def merge_year(year, month_list, directory='logs', previous=None, *, chunksize=None, workers=4, store=None):
+    """
+    Merge the simulated months of a year into the `logs_<year>.csv` and `hackers_<year>.csv` files.
+
+    Parameters:
+        - year: The year the months belong to.
+        - month_list: The list of the months (in order) as formatted in the file names.
+        - directory: The directory holding the monthly files and receiving the merged ones.
+        - previous: Tuple of the (logs, hackers) `pandas.DataFrame` objects returned
+                    for the prior year, if it was simulated.
+        - chunksize: If provided, stream the files through `stream_csvs()` with chunks of
+                     this many rows instead of reading them into memory with `cat_csvs()`.
+        - workers: The number of threads to use for parsing the files when streaming.
+        - store: If provided, also write the merged data to the month-partitioned `logs` and
+                 `hackers` tables of the columnar store in this directory (see `log_store`).
+
+    Returns:
+        Tuple of the (logs, hackers) `pandas.DataFrame` objects holding the rows past the
+        simulated months, so that their spillover can be passed on to the next year. When
+        not streaming, these are the full merged data before they were cut to the simulated months.
+    """
+    # sometimes the simulation overshoots the end date, so only keep the simulated months
+    first = f'{year}-{MONTHS.index(month_list[0]) + 1:02d}'
+    last = f'{year}-{MONTHS.index(month_list[-1]) + 1:02d}'
+    previous = previous or (None, None)
 
-    logs_2019 = pd.concat([cat_csvs('logs/{}_2019.csv', 'datetime', ['jan', 'feb', 'mar']), get_spillover(logs_2018, '2019')]).sort_index()
-    logs_2019.loc['2019-Q1'].to_csv('logs/logs_2019.csv') # sometimes the simulation overshoots the end date
+    merged = []
+    for prefix, file_pattern, index_col, parse_dates, previous_data in zip(
+        ['logs', 'hackers'], ['{}_%s.csv', 'hackers_{}_%s.csv'], ['datetime', 'start'], [[], ['end']], previous
+    ):
+        file_pattern = os.path.join(directory, file_pattern % year)
+        out_file = os.path.join(directory, f'{prefix}_{year}.csv')
+        partition_writer = log_store.PartitionWriter(store, prefix, parse_dates) if store else None
 
-    hackers_2018 = cat_csvs(
-        'logs/hackers_{}_2018.csv', 'start',
-        ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec']
+        if chunksize:
+            merged.append(stream_csvs(
+                file_pattern, index_col, month_list, out_file, chunksize=chunksize, workers=workers,
+                spillover=get_spillover(previous_data, str(year)) if previous_data is not None else None,
+                start=pd.Period(first, 'M').start_time, end=pd.Period(last, 'M').end_time,
+                partition_writer=partition_writer
+            ))
+        else:
+            data = merge_month_files(file_pattern, index_col, month_list, previous_data, str(year))
+            data.loc[first:last].to_csv(out_file, date_format=DATE_FORMAT)
+            if partition_writer is not None:
+                partition_writer.append(data.loc[first:last])
+            merged.append(data)
+
+        if partition_writer is not None:
+            partition_writer.close()
+
+    return tuple(merged)
+
+def fingerprint_file(file, previous=None):
+    """
+    Get the size, modification time, and SHA-256 hash of a file. The file
+    is only read if its size or modification time differ from `previous`.
+
+    Parameters:
+        - file: The path to the file.
+        - previous: The fingerprint of the file from the last time we saw it.
+
+    Returns:
+        A dictionary with the size, mtime, and sha256 of the file (plus anything
+        else stored in `previous` if the file hasn't changed).
+    """
+    stat = os.stat(file)
+    fingerprint = {'size': stat.st_size, 'mtime': stat.st_mtime}
+    if previous and all(previous.get(key) == value for key, value in fingerprint.items()):
+        return dict(previous)
+
+    sha256 = hashlib.sha256()
+    with open(file, 'rb') as f:
+        for block in iter(lambda: f.read(2**20), b''):
+            sha256.update(block)
+    fingerprint['sha256'] = sha256.hexdigest()
+    if previous and previous.get('sha256') == fingerprint['sha256']:
+        # only the modification time changed, so what we know about its contents still holds
+        return {**previous, **fingerprint}
+    return fingerprint
+
+def _overlaps(info, start, end):
+    """Check if the datetimes in a manifest entry overlap with the range [start, end]."""
+    return bool(info) and info.get('min') is not None \
+        and pd.Timestamp(info['min']) <= end and pd.Timestamp(info['max']) >= start
+
+def merge_incremental(years, directory='logs', manifest_file=None):
+    """
+    Merge the simulated months like `merge_year()`, but only re-read the monthly files
+    that changed since the last run and only rewrite the part of each merged file that
+    they affect. This uses a manifest of each monthly file's size, modification time, and
+    hash, along with the span of rows (and bytes) it occupies in each merged file.
+
+    Rows that spilled over from one year into the next are handled by treating every
+    monthly file with rows in a merged file's time range as one of its inputs.
+
+    Parameters:
+        - years: Dictionary mapping each year to its list of months (in order)
+                 as formatted in the file names.
+        - directory: The directory holding the monthly files and receiving the merged ones.
+        - manifest_file: The file to keep the manifest in. Defaults to `merge_manifest.json`
+                         in `directory`.
+
+    Returns:
+        The list of merged files that were (re)written.
+    """
+    manifest_file = manifest_file or os.path.join(directory, MANIFEST_FILE)
+    try:
+        with open(manifest_file, 'r') as file:
+            manifest = json.load(file)
+    except FileNotFoundError:
+        manifest = {'inputs': {}, 'outputs': {}}
+
+    rewritten = []
+    for prefix, file_pattern, index_col in zip(
+        ['logs', 'hackers'], ['{}_{}.csv', 'hackers_{}_{}.csv'], ['datetime', 'start']
+    ):
+        # figure out which monthly files changed, reading only those
+        old_inputs = manifest['inputs'].get(prefix, {})
+        inputs, changed, frames = {}, set(), {}
+        for year, month_list in years.items():
+            for month in month_list:
+                name = file_pattern.format(month, year)
+                inputs[name] = fingerprint_file(os.path.join(directory, name), old_inputs.get(name))
+                if 'min' not in inputs[name]:
+                    changed.add(name)
+                    data = frames[name] = pd.read_csv(
+                        os.path.join(directory, name), index_col=index_col, parse_dates=True
+                    ).sort_index(kind='mergesort')
+                    inputs[name]['min'] = str(data.index.min()) if not data.empty else None
+                    inputs[name]['max'] = str(data.index.max()) if not data.empty else None
+        changed.update(set(old_inputs) - set(inputs)) # files that were removed
+
+        def read(name):
+            """Read a monthly file (it has no rows anymore if it was removed)."""
+            if name not in frames:
+                frames[name] = pd.read_csv(
+                    os.path.join(directory, name), index_col=index_col, parse_dates=True
+                ).sort_index(kind='mergesort') if name in inputs else pd.DataFrame()
+            return frames[name]
+
+        for year, month_list in years.items():
+            start = pd.Period(f'{year}-{MONTHS.index(month_list[0]) + 1:02d}', 'M').start_time
+            end = pd.Period(f'{year}-{MONTHS.index(month_list[-1]) + 1:02d}', 'M').end_time
+            out_name = f'{prefix}_{year}.csv'
+            out_file = os.path.join(directory, out_name)
+
+            output = manifest['outputs'].get(out_name)
+            rebuild = output is None or output['period'] != [str(start), str(end)] \
+                or not os.path.exists(out_file)
+            sources = {} if rebuild else output['sources']
+
+            if rebuild:
+                affected = {name for name, info in inputs.items() if _overlaps(info, start, end)}
+            else:
+                affected = {
+                    name for name in changed if name in sources or _overlaps(inputs.get(name), start, end)
+                }
+            if not affected:
+                continue
+
+            # grow the set of files to re-merge until no other file has rows in their time range
+            while True:
+                rows = {name: read(name).loc[start:end] for name in affected if not read(name).empty}
+                bounds = [
+                    pd.Timestamp(sources[name][key]) for name in affected if name in sources
+                    for key in ['min', 'max']
+                ] + [
+                    timestamp for data in rows.values() if not data.empty
+                    for timestamp in [data.index.min(), data.index.max()]
+                ]
+                low, high = min(bounds, default=end), max(bounds, default=start)
+                overlapping = {
+                    name for name, info in sources.items()
+                    if name not in affected and _overlaps(info, low, high)
+                }
+                if not overlapping:
+                    break
+                affected |= overlapping
+
+            # the rows of the affected files are contiguous in the merged file, so we splice in the new ones
+            region = pd.concat([
+                rows[name].assign(_source=name) for name in inputs if name in rows and not rows[name].empty
+            ]).sort_index(kind='mergesort') if any(not data.empty for data in rows.values()) else None
+            labels = region.pop('_source').to_numpy() if region is not None else np.array([])
+            lines = region.to_csv(header=False, date_format=DATE_FORMAT).encode().splitlines(keepends=True) \
+                if region is not None else []
+            offsets = np.cumsum([0] + [len(line) for line in lines])
+
+            if rebuild:
+                contents = region.iloc[:0].to_csv(date_format=DATE_FORMAT).encode() if region is not None else b''
+                row_start = row_end = 0
+                byte_start = byte_end = len(contents)
+            else:
+                with open(out_file, 'rb') as file:
+                    contents = file.read()
+                old_spans = [sources[name] for name in affected if name in sources]
+                if old_spans:
+                    row_start, row_end = min(s['rows'][0] for s in old_spans), max(s['rows'][1] for s in old_spans)
+                    byte_start, byte_end = min(s['bytes'][0] for s in old_spans), max(s['bytes'][1] for s in old_spans)
+                else:
+                    # these are new rows, so they go before the first file with later rows
+                    following = [
+                        info for name, info in sources.items() if pd.Timestamp(info['min']) > high
+                    ]
+                    row_start = row_end = min((s['rows'][0] for s in following), default=output['rows'])
+                    byte_start = byte_end = min((s['bytes'][0] for s in following), default=len(contents))
+
+            temp_file = f'{out_file}.tmp'
+            with open(temp_file, 'wb') as file:
+                file.write(contents[:byte_start])
+                file.writelines(lines)
+                file.write(contents[byte_end:])
+            os.replace(temp_file, out_file)
+            rewritten.append(out_file)
+
+            # shift the spans of the files after the splice and record those of the files we re-merged
+            row_shift, byte_shift = len(lines) - (row_end - row_start), int(offsets[-1]) - (byte_end - byte_start)
+            for name, info in sources.items():
+                if name not in affected and info['bytes'][0] >= byte_end:
+                    info['rows'] = [info['rows'][0] + row_shift, info['rows'][1] + row_shift]
+                    info['bytes'] = [info['bytes'][0] + byte_shift, info['bytes'][1] + byte_shift]
+            for name in affected:
+                positions = np.flatnonzero(labels == name)
+                if not positions.size:
+                    sources.pop(name, None)
+                    continue
+                first, last = positions[0], positions[-1] + 1
+                sources[name] = {
+                    'min': str(region.index[first]), 'max': str(region.index[last - 1]),
+                    'rows': [int(row_start + first), int(row_start + last)],
+                    'bytes': [int(byte_start + offsets[first]), int(byte_start + offsets[last])]
+                }
+            manifest['outputs'][out_name] = {
+                'period': [str(start), str(end)],
+                'rows': (0 if rebuild else output['rows']) + row_shift,
+                'sources': dict(sorted(sources.items()))
+            }
+
+        manifest['inputs'][prefix] = inputs
+
+    with open(manifest_file, 'w') as file:
+        json.dump(manifest, file, indent=2)
+
+    return rewritten
+
+if __name__ == '__main__':
+    # command line argument parsing
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '-c', '--chunksize', type=int,
+        help='stream the files in chunks of this many rows instead of reading them into memory'
+    )
+    parser.add_argument(
+        '-w', '--workers', type=int, default=4, help='number of threads to parse files with when streaming'
+    )
+    parser.add_argument(
+        '-s', '--store', action='store_true',
+        help='also write the merged logs to the month-partitioned columnar store in logs/store/'
+    )
+    parser.add_argument(
+        '-i', '--incremental', action='store_true',
+        help=f'only re-merge the monthly files that changed since the last run (tracked in logs/{MANIFEST_FILE})'
     )
-    hackers_2018.loc['2018'].to_csv('logs/hackers_2018.csv')
+    args = parser.parse_args()
+    if args.incremental and (args.chunksize or args.store):
+        parser.error('--incremental cannot be combined with --chunksize or --store')
 
-    hackers_2019 = pd.concat([
-        cat_csvs('logs/hackers_{}_2019.csv', 'start', ['jan', 'feb', 'mar']), get_spillover(hackers_2018, '2019')
-    ]).sort_index()
-    hackers_2019.loc['2019-Q1'].to_csv('logs/hackers_2019.csv')
+    # make sure we write the files to the proper directory no matter where we called the script from
+    directory = os.path.dirname(os.path.realpath(sys.argv[0]))
+    os.chdir(directory)
+
+    if args.incremental:
+        for file in merge_incremental({2018: MONTHS, 2019: ['jan', 'feb', 'mar']}):
+            print(f'Rewrote {file}')
+    else:
+        options = dict(
+            chunksize=args.chunksize, workers=args.workers,
+            store=os.path.join('logs', 'store') if args.store else None
+        )
+        merged_2018 = merge_year(2018, MONTHS, **options)
+        merge_year(2019, ['jan', 'feb', 'mar'], previous=merged_2018, **options)
 
     print('All done!')
@@ -0,0 +1,75 @@
+"""Script for combining the profiles written by `simulate.py --profile` into one summary."""
+
+import argparse
+import json
+import logging
+import os
+
+# Logging configuration
+FORMAT = '[%(levelname)s] [ %(name)s ] %(message)s'
+logging.basicConfig(level=logging.INFO, format=FORMAT)
+logger = logging.getLogger(os.path.basename(__file__))
+
+def summarize_profiles(profile_files):
+    """
+    Combine the profiles of several simulations (like the months in `run_simulations.sh`).
+
+    Parameters:
+        - profile_files: The JSON files written by `simulate.py --profile`.
+
+    Returns:
+        A dictionary with the totals for each phase (seconds and runs are summed, the peak
+        memory is the highest of any run), the overall events per second of the simulation
+        phases, and the summary of each profile (keyed by its file name without the extension).
+    """
+    runs, phases = {}, {}
+    for profile_file in sorted(profile_files):
+        with open(profile_file, 'r') as file:
+            profile = json.load(file)
+        runs[os.path.splitext(os.path.basename(profile_file))[0]] = profile
+
+        for name, stats in profile['phases'].items():
+            totals = phases.setdefault(name, {'seconds': 0, 'peak_memory_mb': 0, 'runs': 0})
+            totals['seconds'] += stats['seconds']
+            totals['peak_memory_mb'] = max(totals['peak_memory_mb'], stats['peak_memory_mb'])
+            totals['runs'] += stats['runs']
+
+    total_seconds = sum(run['total_seconds'] for run in runs.values())
+    for totals in phases.values():
+        totals['share'] = totals['seconds'] / total_seconds if total_seconds else None
+
+    events = sum(run['events'] for run in runs.values())
+    simulation_seconds = phases.get('simulation', {}).get('seconds')
+    return {
+        'total_seconds': total_seconds,
+        'events': events,
+        'events_per_second': events / simulation_seconds if simulation_seconds else None,
+        'phases': phases,
+        'runs': runs
+    }
+
+if __name__ == '__main__':
+    # command line argument parsing
+    parser = argparse.ArgumentParser()
+    parser.add_argument('profiles', nargs='+', help='profile files written by simulate.py --profile')
+    parser.add_argument(
+        '-o', '--output', help='file to write the combined summary to (defaults to standard output)'
+    )
+    args = parser.parse_args()
+
+    summary = summarize_profiles(args.profiles)
+    for name, totals in sorted(summary['phases'].items(), key=lambda x: -x[1]['seconds']):
+        logger.info(
+            f"{name}: {totals['seconds']:.2f} seconds ({totals['share'] or 0:.1%}) over {totals['runs']} runs, "
+            f"peak of {totals['peak_memory_mb']:.1f} MB"
+        )
+    logger.info(
+        f"{summary['events']} events in {summary['total_seconds']:.2f} seconds "
+        f"({summary['events_per_second'] or 0:.0f} events per second of simulation)"
+    )
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(summary, file, indent=2)
+    else:
+        print(json.dumps(summary, indent=2))
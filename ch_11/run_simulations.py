@@ -0,0 +1,205 @@
+"""Script for simulating the months in a schedule in parallel and merging the logs."""
+
+import argparse
+import calendar
+import collections
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import csv
+import datetime as dt
+import json
+import logging
+import os
+import subprocess
+import sys
+
+import merge_logs
+import profile_summary
+
+# Logging configuration
+FORMAT = '[%(levelname)s] [ %(name)s ] %(message)s'
+logging.basicConfig(level=logging.INFO, format=FORMAT)
+logger = logging.getLogger(os.path.basename(__file__))
+
+def read_schedule(schedule_file):
+    """
+    Read the month-by-month simulation schedule.
+
+    Parameters:
+        - schedule_file: CSV file with the columns start, days, seed,
+          attack_prob, try_all_users_prob, and stealthy (one row per month).
+
+    Returns:
+        A list of dictionaries (one per month) with the values as they were written
+        in the file, plus the `start_date`, `year`, and `month` of the simulation.
+    """
+    with open(schedule_file, 'r') as file:
+        schedule = list(csv.DictReader(file))
+
+    for month in schedule:
+        month['start_date'] = dt.datetime.strptime(month['start'], '%Y-%m-%d')
+        month['year'] = month['start_date'].year
+        month['month'] = merge_logs.MONTHS[month['start_date'].month - 1]
+        month['stealthy'] = month['stealthy'].strip().lower() in ['true', '1', 'yes']
+    return schedule
+
+def get_month_files(month, directory):
+    """Get the paths to the (log, hack log) files for a simulated month."""
+    return (
+        os.path.join(directory, f"{month['month']}_{month['year']}.csv"),
+        os.path.join(directory, f"hackers_{month['month']}_{month['year']}.csv")
+    )
+
+def get_profile_file(month, directory):
+    """Get the path to the profile of a simulated month."""
+    return os.path.join(directory, f"profile_{month['month']}_{month['year']}.json")
+
+def simulate_month(month, directory, profile=False):
+    """
+    Run `simulate.py` for a single month in its own Python process.
+
+    Parameters:
+        - month: A dictionary from the schedule (see `read_schedule()`).
+        - directory: The directory to write the month's log files to.
+        - profile: Whether to have `simulate.py` write the profile of the month (see `get_profile_file()`).
+
+    Returns:
+        The `month` that was simulated.
+    """
+    log_file, hack_log_file = get_month_files(month, directory)
+    command = [sys.executable, 'simulate.py', '-s', month['seed']]
+    if month['stealthy']:
+        command.append('--stealthy')
+    if profile:
+        command.extend(['--profile', get_profile_file(month, directory)])
+    command.extend([
+        '-l', log_file, '-hl', hack_log_file, month['days'], month['start'],
+        month['attack_prob'], month['try_all_users_prob']
+    ])
+
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    if result.returncode:
+        logger.error(result.stdout)
+        result.check_returncode()
+    return month
+
+def run_simulations(schedule, directory='logs', workers=None, clean_up=True, chunksize=None, store=False,
+                    profile=False):
+    """
+    Simulate every month in the schedule in parallel, merging each year
+    as soon as all of its months (and the prior year) are ready.
+
+    Parameters:
+        - schedule: The list of months returned by `read_schedule()`.
+        - directory: The directory to write the log files to.
+        - workers: The number of months to simulate at once. Defaults to the number of CPUs.
+        - clean_up: Whether to remove the monthly files once they have been merged.
+        - chunksize: If provided, stream the monthly files into the merged ones in chunks
+                     of this many rows (see `merge_logs.stream_csvs()`).
+        - store: Whether to also write the merged logs to the columnar store
+                 in the `store/` subdirectory of `directory` (see `log_store`).
+        - profile: Whether to profile the simulation of each month, combining the profiles
+                   in `simulation_profile.json` in `directory` (see `profile_summary`).
+
+    Returns:
+        None
+    """
+    if not os.path.exists(directory):
+        os.mkdir(directory)
+
+    months_left = collections.Counter(month['year'] for month in schedule)
+    years = sorted(months_left)
+    month_lists = {
+        year: [
+            month['month'] for month in sorted(schedule, key=lambda x: x['start_date'])
+            if month['year'] == year
+        ] for year in years
+    }
+    merged = {}
+
+    def merge(year):
+        """Merge a year, carrying the spillover of the prior year into it."""
+        logger.info(f'Merging files for {year}...')
+        merged[year] = merge_logs.merge_year(
+            year, month_lists[year], directory, previous=merged.pop(year - 1, None),
+            chunksize=chunksize, store=os.path.join(directory, 'store') if store else None
+        )
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as simulations, \
+            ThreadPoolExecutor(max_workers=1) as merger:
+        futures = []
+        for month in schedule:
+            logger.info(f"Simulating {calendar.month_name[month['start_date'].month]} {month['year']}...")
+            futures.append(simulations.submit(simulate_month, month, directory, profile))
+
+        merges, next_year = [], 0
+        for future in as_completed(futures):
+            month = future.result()
+            logger.info(f"Finished simulating {calendar.month_name[month['start_date'].month]} {month['year']}")
+            months_left[month['year']] -= 1
+
+            # years are merged in order, since each one needs the spillover of the year before it
+            while next_year < len(years) and not months_left[years[next_year]]:
+                merges.append(merger.submit(merge, years[next_year]))
+                next_year += 1
+
+        for future in merges:
+            future.result()
+
+    if profile:
+        logger.info('Summarizing the profiles...')
+        profile_files = [get_profile_file(month, directory) for month in schedule]
+        with open(os.path.join(directory, 'simulation_profile.json'), 'w') as file:
+            json.dump(profile_summary.summarize_profiles(profile_files), file, indent=2)
+
+    if clean_up:
+        logger.info('Cleaning up...')
+        for month in schedule:
+            for file in get_month_files(month, directory):
+                os.remove(file)
+            if profile:
+                os.remove(get_profile_file(month, directory))
+
+if __name__ == '__main__':
+    # command line argument parsing
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '-t', '--schedule',
+        help='CSV file with the start, days, seed, attack_prob, try_all_users_prob, and stealthy columns '
+        '(defaults to simulation_schedule.csv)'
+    )
+    parser.add_argument(
+        '-w', '--workers', type=int, help='number of months to simulate at once (defaults to the CPU count)'
+    )
+    parser.add_argument(
+        '-l', '--logs', help='directory to write the logs to (defaults to logs/)'
+    )
+    parser.add_argument(
+        '-c', '--chunksize', type=int,
+        help='stream the monthly files in chunks of this many rows when merging'
+    )
+    parser.add_argument(
+        '-s', '--store', action='store_true',
+        help='also write the merged logs to the month-partitioned columnar store in the store/ subdirectory'
+    )
+    parser.add_argument(
+        '-k', '--keep', action='store_true', help='keep the monthly files after merging'
+    )
+    parser.add_argument(
+        '-p', '--profile', action='store_true',
+        help='profile the simulation of each month, combining the profiles in simulation_profile.json'
+    )
+    args = parser.parse_args()
+
+    # paths provided are relative to where we are called from, but simulate.py needs to run from here
+    schedule_file = os.path.abspath(args.schedule) if args.schedule else None
+    logs_directory = os.path.abspath(args.logs) if args.logs else 'logs'
+    os.chdir(os.path.dirname(os.path.realpath(sys.argv[0])))
+
+    schedule = read_schedule(schedule_file or 'simulation_schedule.csv')
+
+    run_simulations(
+        schedule, logs_directory, args.workers, clean_up=not args.keep,
+        chunksize=args.chunksize, store=args.store, profile=args.profile
+    )
+
+    logger.info('Success!')